@@ -0,0 +1,148 @@
+from dataclasses import asdict, dataclass
+import json
+import os
+import shutil
+
+import cmdstanpy
+import numpy as np
+
+
+# Every parameter block variable of model.stan, inits need all of them
+SAMPLED_VARS = ["mu", "is_home", "att", "def", "att_sigma", "def_sigma"]
+
+# A warm fit starts next to the typical set with a good metric, so a short warmup is enough:
+# a brief step size phase, one metric window and a final step size phase
+WARM_WARMUP = 200
+WARM_ADAPT = {"adapt_init_phase": 25, "adapt_metric_window": 150, "adapt_step_size": 25}
+
+# A warm fit is rejected when it's worse than both this and the fit it was started from
+RHAT_LIMIT = 1.01
+
+
+@dataclass
+class Adaptation:
+    """
+    Sampler state adapted by the latest fit of a season, enough to warm start the next one.
+    """
+    season: str
+    max_date: str
+    n_teams: int
+    step_size: list[float]
+    inv_metric: list[list[float]]
+    inits: dict[str, float | list[float]]
+    max_rhat: float
+    divergences: int
+
+    def sample_args(self) -> dict:
+        # keyword arguments for CmdStanModel.sample, one step size/metric per chain
+        return {
+            "chains": len(self.step_size),
+            "inits": self.inits,
+            "step_size": self.step_size,
+            "inv_metric": [np.array(m) for m in self.inv_metric],
+            "iter_warmup": WARM_WARMUP,
+            **WARM_ADAPT
+        }
+
+
+def split_rhat(draws: np.ndarray) -> np.ndarray:
+    # draws is (iterations, chains, params), returns the split R-hat of every param
+    n = draws.shape[0] // 2
+    halves = np.concatenate([draws[:n], draws[n:2 * n]], axis=1)
+
+    chain_means = halves.mean(axis=0)
+    within = halves.var(axis=0, ddof=1).mean(axis=0)
+    between = n * chain_means.var(axis=0, ddof=1)
+    var_hat = (n - 1) / n * within + between / n
+    return np.sqrt(var_hat / within)
+
+
+def ess(draws: np.ndarray) -> np.ndarray:
+    # draws is (iterations, chains, params), returns the effective sample size of every param
+    # (Stan's multi-chain estimator with Geyer's initial positive sequence, no rank normalization)
+    n, m = draws.shape[:2]
+    centered = draws - draws.mean(axis=0)
+    f = np.fft.rfft(centered, n=2 * n, axis=0)
+    acov = np.fft.irfft(f * np.conj(f), axis=0)[:n] / n
+
+    within = acov[0].mean(axis=0) * n / (n - 1)
+    var_plus = within * (n - 1) / n + (draws.mean(axis=0).var(axis=0, ddof=1) if m > 1 else 0)
+    rho = 1 - (within - acov.mean(axis=1)) / var_plus
+
+    pairs = rho[:n - n % 2:2] + rho[1::2]
+    positive = np.cumprod(pairs > 0, axis=0).astype(bool)
+    tau = -1 + 2 * np.sum(np.where(positive, pairs, 0), axis=0)
+    return n * m / np.maximum(tau, 1 / np.log10(n * m))
+
+
+def sampled_draws(fit: cmdstanpy.CmdStanMCMC) -> np.ndarray:
+    # (iterations, chains, params) draws of SAMPLED_VARS
+    cols = [i for i, c in enumerate(fit.column_names) if c.split("[")[0] in SAMPLED_VARS]
+    return fit.draws(concat_chains=False)[:, :, cols]
+
+
+def diagnose(fit: cmdstanpy.CmdStanMCMC) -> tuple[float, int]:
+    # (max split R-hat over the sampled params, divergent transitions summed over chains)
+    return float(np.max(split_rhat(sampled_draws(fit)))), int(np.sum(fit.divergences))
+
+
+def from_fit(fit: cmdstanpy.CmdStanMCMC, season: str, max_date: str, n_teams: int, diagnostics: tuple[float, int] | None = None) -> Adaptation:
+    # diagnostics is diagnose(fit) when the caller already has it
+    max_rhat, divergences = diagnose(fit) if diagnostics is None else diagnostics
+    return Adaptation(
+        season,
+        max_date,
+        n_teams,
+        fit.step_size.tolist(),
+        fit.inv_metric.tolist(),
+        # posterior means, the next day's posterior barely moves from here
+        {v: fit.stan_variable(v).mean(axis=0).tolist() for v in SAMPLED_VARS},
+        max_rhat,
+        divergences
+    )
+
+
+def degraded(diagnostics: tuple[float, int], prev: Adaptation) -> bool:
+    # diagnostics is diagnose() of the warm fit started from prev
+    max_rhat, divergences = diagnostics
+    return max_rhat > max(RHAT_LIMIT, prev.max_rhat) or divergences > prev.divergences
+
+
+class AdaptationStore:
+    """
+    Latest Adaptation per season, as json next to the cached posteriors.
+    """
+
+    def __init__(self, cache_dir: str):
+        self.cache_dir = cache_dir
+
+    def _path(self, season: str) -> str:
+        return os.path.join(self.cache_dir, f"{season}_adaptation.json")
+
+    def get(self, season: str, n_teams: int) -> Adaptation | None:
+        # None when there is nothing stored, or the metric is sized for a different team count
+        path = self._path(season)
+        if not os.path.exists(path):
+            return None
+
+        with open(path, "r") as f:
+            adapt = Adaptation(**json.load(f))
+        return adapt if adapt.n_teams == n_teams else None
+
+    def put(self, adapt: Adaptation) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        path = self._path(adapt.season)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(adapt), f)
+        os.replace(tmp_path, path)
+
+    def fork(self, season: str, cache_dir: str) -> "AdaptationStore":
+        # Store under cache_dir seeded with this store's adaptation for season, so a run of fits
+        # can chain warm starts without touching (or racing on) the shared one
+        store = AdaptationStore(cache_dir)
+        if os.path.exists(self._path(season)):
+            os.makedirs(cache_dir, exist_ok=True)
+            shutil.copyfile(self._path(season), store._path(season))
+        return store
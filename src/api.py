@@ -1,13 +1,22 @@
-from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse
+from contextlib import asynccontextmanager, nullcontext
+
+import asyncio
+
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from starlette.concurrency import run_in_threadpool
 
 import polars as pl
 import requests
 from datetime import date, timedelta, datetime
+import time
 
 import model as model
+import fit_service as fit_service
+import jobs as jobs
+import metrics as metrics
 # import src.helper as helper
 import helper as helper
 
@@ -16,52 +25,210 @@ templates = Jinja2Templates(directory="templates")
 
 Mod = model.GamePredModel(
     "data/data.db",
-    "src/model/model.stan"
+    "src/model/model.stan",
+    warm_start=True
 )
+Fits = fit_service.FitService(Mod)
+Jobs = jobs.JobStore()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    Fits.shutdown()
+
 
+app = FastAPI(lifespan=lifespan)
 
 
-app = FastAPI()
+@app.middleware("http")
+async def time_request(request: Request, call_next):
+    # Request latency per route. Opt in to a per request profile with ?profile=1 or an X-Profile: 1
+    # header, the request's spans (fit worker included) come back in a Server-Timing header
+    profiled = request.query_params.get("profile") == "1" or request.headers.get("x-profile") == "1"
+    t0 = time.perf_counter()
+    try:
+        with metrics.profile() if profiled else nullcontext([]) as spans:
+            response = await call_next(request)
+    finally:
+        seconds = time.perf_counter() - t0
+        route = request.scope.get("route")
+        metrics.observe("http_request_seconds", seconds, route=route.path if route is not None else "unmatched", method=request.method)
+
+    if profiled:
+        totals = {}
+        for name, s in spans:
+            totals[name] = totals.get(name, 0.0) + s
+        response.headers["Server-Timing"] = ", ".join(
+            [f"{name};dur={s * 1000:.1f}" for name, s in totals.items()] + [f"total;dur={seconds * 1000:.1f}"]
+        )
+    return response
+
 
 @app.get("/", response_class=HTMLResponse)
 async def root(request: Request):
     return templates.TemplateResponse(request=request, name="main3.html")
 
 
-@app.get("/game/{date_of_pred}")
-async def get_predictions(date_of_pred: str, home_team: str, away_team: str):
-    season = helper.get_nhl_season(date_of_pred)
+def check_mode(mode: str) -> str:
+    if mode not in model.INFERENCE_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {model.INFERENCE_MODES}")
+    return mode
+
 
-    out = Mod.get_prediction(date_of_pred, season, home_team, away_team)
-    return { 
+async def fit_posterior(date_of_pred: str, season: str, job: jobs.Job | None = None, mode: str = "sample") -> None:
+    # Awaits the (shared) fit, reporting sampler progress on job if given
+    fit = asyncio.ensure_future(Fits.posterior(date_of_pred, season, mode))
+    if job is not None:
+        Jobs.update(job, stage="fitting")
+        while not fit.done():
+            await asyncio.wait({fit}, timeout=0.5)
+            progress = Fits.progress(date_of_pred, season, mode)
+            if progress is not None and progress != job.progress:
+                Jobs.update(job, stage="sampling", progress=progress)
+    await fit
+
+
+async def predict_game(date_of_pred: str, home_team: str, away_team: str, job: jobs.Job | None = None, mode: str = "sample") -> model.PredResult:
+    # pred_goal_data first (NUTS only), otherwise the (possibly fitted off-loop) posterior for the date
+    out = None
+    if mode == "sample":
+        out = await run_in_threadpool(Mod.get_stored_prediction, date_of_pred, home_team, away_team)
+    if out is None:
+        season = helper.get_nhl_season(date_of_pred)
+        await fit_posterior(date_of_pred, season, job, mode)
+        out = await run_in_threadpool(Mod.get_prediction, date_of_pred, season, home_team, away_team, mode)
+    return out
+
+
+def game_payload(out: model.PredResult, mode: str) -> dict:
+    payload = { 
         'table_of_pred': out.pred_table.to_dicts(), 
-        'home_team_win_prob': round(out.prob_home_team_win * 100, 2)
+        'home_team_win_prob': round(out.prob_home_team_win * 100, 2),
+        'inference_mode': mode
     }
+    if out.outcome_probs is not None:
+        payload['outcome_probs'] = {k: round(v * 100, 2) for k, v in out.outcome_probs.items()}
+    return payload
+
+
+@app.get("/game/{date_of_pred}")
+async def get_predictions(date_of_pred: str, home_team: str, away_team: str, mode: str = "sample"):
+    out = await predict_game(date_of_pred, home_team, away_team, mode=check_mode(mode))
+    return game_payload(out, mode)
+
+
+async def ensure_todays_posterior(job: jobs.Job | None = None, mode: str = "sample") -> None:
+    today_date = datetime.now().strftime("%Y-%m-%d")
+    await fit_posterior(today_date, helper.get_nhl_season(today_date), job, mode)
+
+
+async def season_projection(job: jobs.Job | None = None, mode: str = "sample") -> dict:
+    if mode != "sample" or await run_in_threadpool(Mod.get_stored_season_prediction) is None:
+        await ensure_todays_posterior(job, mode)
+    if job is not None:
+        Jobs.update(job, stage="simulating")
+    return await run_in_threadpool(Mod.get_season_prediction, False, None, mode)
 
 
 @app.get("/season_projection")
-async def get_season_projection():
-    return Mod.get_season_prediction()
+async def get_season_projection(mode: str = "sample"):
+    return await season_projection(mode=check_mode(mode))
 
 
 @app.get("/season_projection_plot")
 async def get_season_projection_plot():
-    return Mod.get_season_projection_box_plot()
+    if await run_in_threadpool(Mod.get_stored_season_prediction) is None:
+        await ensure_todays_posterior()
+    return await run_in_threadpool(Mod.get_season_projection_box_plot)
 
 
 @app.get("/game/{date_of_pred}/heatmap")
-async def get_heatmap(date_of_pred: str, home_team: str, away_team: str):
+async def get_heatmap(date_of_pred: str, home_team: str, away_team: str, mode: str = "sample"):
     season = helper.get_nhl_season(date_of_pred)
-    return Mod.get_prediction_heatmap_html(date_of_pred, season, home_team, away_team)
+    if check_mode(mode) != "sample" or await run_in_threadpool(Mod.get_stored_prediction, date_of_pred, home_team, away_team) is None:
+        await Fits.posterior(date_of_pred, season, mode)
+    return await run_in_threadpool(Mod.get_prediction_heatmap_html, date_of_pred, season, home_team, away_team, mode)
 
 
 @app.get("/team_params")
-async def get_team_params():
+async def get_team_params(diagnostics: bool = False):
+    # diagnostics=true adds the full summary (ess, r_hat, ...) of today's posterior, computed once per posterior
+    team_params = await run_in_threadpool(Mod.get_stored_team_params)
+    if team_params is None or diagnostics:
+        await ensure_todays_posterior()
+    if team_params is None:
+        team_params = await run_in_threadpool(Mod.get_team_params)
+
+    out = {
+        "team_params": team_params.to_dicts()
+    }
+    if diagnostics:
+        today_date = datetime.now().strftime("%Y-%m-%d")
+        summary = await run_in_threadpool(Mod.get_posterior_diagnostics, today_date, helper.get_nhl_season(today_date))
+        out["diagnostics"] = summary.to_dicts()
+    return out
+
+
+@app.get("/team_params_history")
+async def get_team_params_history(season: str | None = None, team: str | None = None):
+    # att/def quantiles per game date, filled by backfill.py and the nightly update
+    if season is None:
+        season = helper.get_nhl_season(datetime.now().strftime("%Y-%m-%d"))
+    history = await run_in_threadpool(Mod.get_team_params_history, season, team)
     return {
-        "team_params": Mod.get_team_params().to_dicts()
+        "season": season,
+        "team_params_history": history.to_dicts()
     }
 
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    # Prometheus scrape target: stage timings, sampler diagnostics, cache hit ratios
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+
 @app.get("/game_ids/{date}")
 async def get_all_games(date: str):
-    return helper.get_game_ids(date)["res"]
+    out = await run_in_threadpool(helper.get_game_ids, date)
+    return out["res"]
+
+
+# ---- prediction jobs: submit, poll or stream ----
+
+@app.post("/jobs/game/{date_of_pred}")
+async def submit_game_job(date_of_pred: str, home_team: str, away_team: str, mode: str = "sample"):
+    check_mode(mode)
+
+    async def run(job: jobs.Job) -> dict:
+        out = await predict_game(date_of_pred, home_team, away_team, job, mode)
+        return game_payload(out, mode)
+
+    params = {"date_of_pred": date_of_pred, "home_team": home_team, "away_team": away_team, "mode": mode}
+    return {"job_id": Jobs.submit("game", params, run).id}
+
+
+@app.post("/jobs/season_projection")
+async def submit_season_projection_job(mode: str = "sample"):
+    check_mode(mode)
+
+    async def run(job: jobs.Job) -> dict:
+        return await season_projection(job, mode)
+
+    return {"job_id": Jobs.submit("season_projection", {"mode": mode}, run).id}
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = Jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def get_job_events(job_id: str):
+    job = Jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(jobs.stream_events(Jobs, job), media_type="text/event-stream")
@@ -0,0 +1,65 @@
+from argparse import ArgumentParser
+import os
+
+import numpy as np
+
+import db as db
+import fit_service as fit_service
+
+
+BACKFILL_WORKERS = int(os.environ.get("BACKFILL_WORKERS", "4"))
+
+
+def _backfill_dates(path_to_db: str, path_to_model: str, options: dict, season: str, dates: list[str]) -> int:
+    """
+    Fits the posterior after each of dates in order and records its team params in
+    team_params_history, committing date by date so an interrupted run resumes where it stopped.
+    With warm_start each fit starts from the one before it.
+    """
+    mod = fit_service.worker_model(path_to_db, path_to_model, None, options, private_season=season)
+    for d in dates:
+        team_params = mod.get_posterior_team_params(d, season)
+        with mod.db.writer() as con:
+            db.insert_team_params_history(con, season, d, team_params)
+        print(f"team_params_history {season} {d}", flush=True)
+
+    return len(dates)
+
+
+def backfill_season(path_to_db: str, path_to_model: str, season: str, dates: list[str] | None = None,
+                    workers: int = BACKFILL_WORKERS, options: dict | None = None) -> int:
+    """
+    Fills team_params_history for the game dates of season (only those in dates, if given) that
+    aren't recorded yet. The dates are split into one contiguous run per worker process so warm
+    starts still chain within each run. Returns the number of dates fitted.
+    """
+    if options is None:
+        options = {"warm_start": True}
+
+    with db.get_manager(path_to_db).reader() as con:
+        done = db.team_params_history_dates(con, season)
+        todo = [d for d in db.game_dates(con, season) if d not in done and (dates is None or d in dates)]
+
+    runs = [r.tolist() for r in np.array_split(np.array(todo), max(1, min(workers, len(todo)))) if len(r) > 0]
+    if len(runs) <= 1:
+        return _backfill_dates(path_to_db, path_to_model, options, season, todo) if len(todo) > 0 else 0
+
+    with fit_service.spawn_pool(len(runs)) as pool:
+        futures = [pool.submit(_backfill_dates, path_to_db, path_to_model, options, season, r) for r in runs]
+        return sum(f.result() for f in futures)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--pathtodb", default="data")
+    parser.add_argument("-m", "--pathtomodel", default="src/model/model.stan")
+    parser.add_argument("-s", "--season", required=True)
+    parser.add_argument("-w", "--workers", type=int, default=BACKFILL_WORKERS)
+    parser.add_argument("--cold", action="store_true", help="fit every date from scratch")
+
+    args = parser.parse_args()
+    n = backfill_season(
+        f"{args.pathtodb}/data.db", args.pathtomodel, args.season,
+        workers=args.workers, options={"warm_start": not args.cold}
+    )
+    print(f"Backfilled {n} dates of {args.season}")
@@ -0,0 +1,93 @@
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, wait
+import json
+import os
+import time
+
+import polars as pl
+
+import db as db
+import evaluation as evaluation
+import fit_service as fit_service
+import model as model
+
+
+BACKTEST_WORKERS = int(os.environ.get("BACKTEST_WORKERS", "4"))
+
+
+def _predict_date(path_to_db: str, path_to_model: str, options: dict, season: str, date_of_game: str, mode: str) -> pl.DataFrame:
+    # Runs inside a pool worker, each warm starting from its own previous fit. Posteriors land in
+    # the shared store, so re-runs only score
+    mod = fit_service.worker_model(path_to_db, path_to_model, None, options, private_season=season)
+    return mod.get_date_prediction(date_of_game, season, mode)
+
+
+def walk_forward(path_to_db: str, path_to_model: str, season: str, start_date: str | None = None, end_date: str | None = None,
+                 mode: str = "sample", workers: int = BACKTEST_WORKERS, time_budget: float | None = None,
+                 options: dict | None = None) -> tuple[pl.DataFrame, dict]:
+    """
+    Walk-forward evaluation over the game dates of season in [start_date, end_date]: each date is
+    predicted from a fit on the days strictly before it, dates run in parallel in date order.
+    With time_budget (seconds), dates not started by then are dropped (dates vs dates_scored).
+    Returns the per game predictions and evaluation.summarize of them.
+    """
+    if options is None:
+        options = {"warm_start": True}
+
+    with db.get_manager(path_to_db).reader() as con:
+        dates = model.walk_forward_dates(con, season, start_date, end_date)
+
+    t0 = time.perf_counter()
+    deadline = t0 + time_budget if time_budget is not None else None
+    preds = []
+
+    pool = fit_service.spawn_pool(workers)
+    try:
+        pending = {pool.submit(_predict_date, path_to_db, path_to_model, options, season, d, mode) for d in dates}
+        while len(pending) > 0:
+            timeout = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            preds += [f.result() for f in done]
+            if deadline is not None and time.perf_counter() >= deadline:
+                # queued dates are dropped, the ones already fitting are still collected
+                pending = {f for f in pending if not f.cancel()}
+                deadline = None
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+    preds = [p for p in preds if p.shape[0] > 0]
+    predictions = pl.concat(preds).sort(["date", "game_id"]) if len(preds) > 0 else pl.DataFrame()
+
+    summary = evaluation.summarize(predictions) if predictions.shape[0] > 0 else {"games": 0}
+    summary.update({
+        "season": season,
+        "mode": mode,
+        "dates": len(dates),
+        "dates_scored": predictions["date"].n_unique() if predictions.shape[0] > 0 else 0,
+        "seconds": round(time.perf_counter() - t0, 3)
+    })
+    return predictions, summary
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--pathtodb", default="data")
+    parser.add_argument("-m", "--pathtomodel", default="src/model/model.stan")
+    parser.add_argument("-s", "--season", required=True)
+    parser.add_argument("--start", default=None)
+    parser.add_argument("--end", default=None)
+    parser.add_argument("--modes", nargs="+", default=["sample"], choices=model.INFERENCE_MODES)
+    parser.add_argument("-w", "--workers", type=int, default=BACKTEST_WORKERS)
+    parser.add_argument("-b", "--budget", type=float, default=None, help="time budget per mode in seconds")
+    parser.add_argument("-o", "--output", default=None, help="write the per game predictions of the first mode as csv")
+
+    args = parser.parse_args()
+    path_to_db = f"{args.pathtodb}/data.db"
+    for i, mode in enumerate(args.modes):
+        predictions, summary = walk_forward(
+            path_to_db, args.pathtomodel, args.season, args.start, args.end,
+            mode=mode, workers=args.workers, time_budget=args.budget
+        )
+        if i == 0 and args.output is not None and predictions.shape[0] > 0:
+            predictions.write_csv(args.output)
+        print(json.dumps(summary), flush=True)
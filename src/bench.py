@@ -0,0 +1,205 @@
+from argparse import ArgumentParser
+from contextlib import redirect_stdout
+from datetime import date, datetime, timedelta
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+
+# Everything runs offline: a synthetic league in a scratch working dir, served by nhl_stub_server.
+# App modules read their endpoints/paths at import, so they're only imported once that's set up.
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(SRC_DIR)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def timed(name: str, fn, **info) -> dict:
+    # Runs fn once, a failing scenario is recorded and the suite moves on
+    t0 = time.perf_counter()
+    try:
+        fn()
+        status, error = "ok", None
+    except Exception as e:
+        status, error = "error", repr(e)
+        traceback.print_exc()
+    result = {"scenario": name, "seconds": round(time.perf_counter() - t0, 4), "status": status, **info}
+    if error is not None:
+        result["error"] = error
+    print(json.dumps(result), file=sys.stderr, flush=True)
+    return result
+
+
+def setup_workdir(workdir: str, port: int) -> None:
+    # Relative paths (data/, src/model, templates/) resolve inside workdir
+    os.makedirs(os.path.join(workdir, "data"), exist_ok=True)
+    for d in ["src", "templates"]:
+        os.symlink(os.path.join(REPO_DIR, d), os.path.join(workdir, d))
+    os.chdir(workdir)
+
+    os.environ["NHL_API_WEB_BASE"] = f"http://127.0.0.1:{port}"
+    os.environ["NHL_API_STATS_BASE"] = f"http://127.0.0.1:{port}"
+    os.environ["NHL_CACHE_PATH"] = os.path.join(workdir, "data", "nhl_cache.db")
+
+
+def run_suite(args) -> dict:
+    port = free_port()
+    workdir = tempfile.mkdtemp(prefix="nhl_bench_")
+    setup_workdir(workdir, port)
+
+    import database_helper as database_helper
+    import metrics as metrics
+    import model as model
+    import nhl_stub_server as nhl_stub_server
+    import synthetic as synthetic
+
+    today = date.today()
+    yesterday = (today - timedelta(days=1)).strftime("%Y-%m-%d")
+    rows = synthetic.generate_league(args.teams, args.seasons, args.games, today, args.seed)
+    played = [r for r in rows if r["home_goals"] is not None]
+    season = synthetic.helper.get_nhl_season(yesterday)
+
+    # the db stops ingest_days short of yesterday, the stub knows the whole schedule
+    ingest_from = (today - timedelta(days=args.ingest_days)).strftime("%Y-%m-%d")
+    synthetic.write_goal_data("data/data.db", [r for r in played if r["date"] < ingest_from])
+    server = nhl_stub_server.serve(nhl_stub_server.FixtureData(rows), port, args.latency)
+
+    last_game = played[-1]
+    results = []
+    try:
+        results.append(timed(
+            "ingest_update_database", lambda: database_helper.update_database("data"),
+            days=args.ingest_days, games=sum(r["date"] >= ingest_from for r in played)
+        ))
+
+        # a fresh posterior dir so the single game scenario pays for its fit
+        mod = model.GamePredModel("data/data.db", "src/model/model.stan", tempfile.mkdtemp(dir=workdir))
+        results.append(timed(
+            "single_game_fit",
+            lambda: mod.get_prediction(last_game["date"], season, last_game["home_team"], last_game["away_team"])
+        ))
+        results.append(timed(
+            "playoff_series",
+            lambda: mod.get_playoff_prediction(last_game["date"], season, last_game["home_team"], last_game["away_team"])
+        ))
+        results.append(timed("season_projection", lambda: mod.get_season_prediction(overwrite=True)))
+
+        results += bench_endpoints(yesterday, last_game, args.job_timeout)
+    finally:
+        server.shutdown()
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "teams": args.teams,
+            "seasons": args.seasons,
+            "games_per_team": args.games,
+            "played_games": len(played),
+            "latency": args.latency,
+            "seed": args.seed
+        },
+        "results": results,
+        "metrics": flat_metrics(metrics.snapshot())
+    }
+
+
+def flat_metrics(snapshot: dict) -> dict:
+    # (name, labels) keys as name{k="v",...} so the snapshot is valid json
+    def key(k: tuple) -> str:
+        name, labels = k
+        return name + ("{" + ",".join(f'{l}="{v}"' for l, v in labels) + "}" if len(labels) > 0 else "")
+    return {kind: {key(k): v for k, v in values.items()} for kind, values in snapshot.items()}
+
+
+def bench_endpoints(yesterday: str, game: dict, job_timeout: float) -> list[dict]:
+    from fastapi.testclient import TestClient
+
+    import api as api
+
+    def get(path: str):
+        def fn():
+            resp = client.get(path)
+            resp.raise_for_status()
+        return fn
+
+    def job(path: str):
+        def fn():
+            resp = client.post(path)
+            resp.raise_for_status()
+            job_id = resp.json()["job_id"]
+            deadline = time.perf_counter() + job_timeout
+            while time.perf_counter() < deadline:
+                status = client.get(f"/jobs/{job_id}").json()
+                if status["status"] == "done":
+                    return
+                if status["status"] == "failed":
+                    raise RuntimeError(status["error"])
+                time.sleep(0.05)
+            raise TimeoutError(f"{path} did not finish in {job_timeout}s")
+        return fn
+
+    matchup = f"home_team={game['home_team']}&away_team={game['away_team']}"
+    endpoints = [
+        ("GET /", get("/")),
+        ("GET /game_ids/{date}", get(f"/game_ids/{yesterday}")),
+        ("GET /team_params", get("/team_params")),
+        ("GET /team_params_history", get("/team_params_history")),
+        ("GET /season_projection", get("/season_projection")),
+        ("GET /season_projection_plot", get("/season_projection_plot")),
+        ("GET /game/{date}", get(f"/game/{game['date']}?{matchup}")),
+        ("GET /game/{date}/heatmap", get(f"/game/{game['date']}/heatmap?{matchup}")),
+        ("GET /game/{date}?mode=laplace", get(f"/game/{game['date']}?{matchup}&mode=laplace")),
+        ("POST /jobs/game/{date}", job(f"/jobs/game/{game['date']}?{matchup}")),
+        ("POST /jobs/season_projection", job("/jobs/season_projection"))
+    ]
+
+    with TestClient(api.app) as client:
+        return [timed(name, fn) for name, fn in endpoints]
+
+
+def git_commit() -> str | None:
+    try:
+        out = subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except Exception:
+        return None
+
+
+if __name__ == "__main__":
+    # Prints (or writes to -o) one json document: meta, per scenario timings/status and the metrics snapshot
+    parser = ArgumentParser()
+    parser.add_argument("--teams", type=int, default=32)
+    parser.add_argument("--seasons", type=int, default=1)
+    parser.add_argument("--games", type=int, default=82, help="games per team per season")
+    parser.add_argument("--ingest-days", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.0, help="stub round trip in seconds")
+    parser.add_argument("--job-timeout", type=float, default=1800)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default=None)
+
+    args = parser.parse_args()
+    if args.output is not None:
+        args.output = os.path.abspath(args.output)
+
+    # the app's own progress prints go to stderr, stdout only carries the report
+    with redirect_stdout(sys.stderr):
+        report = run_suite(args)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,75 @@
+from argparse import ArgumentParser
+import json
+import os
+import time
+
+import polars as pl
+
+import db as db
+import model as model
+import model_registry as model_registry
+
+
+def multi_season_data(path_to_db: str, seasons: list[str], replicate: int, grainsize: int) -> dict:
+    # model_reduce_sum.stan data for every game of seasons, teams numbered over their union.
+    # replicate stacks the games that many times to stand in for a longer history.
+    with db.get_manager(path_to_db).reader() as con:
+        games = pl.concat([db.read_goal_data(con, s, "9999-12-31") for s in seasons])
+
+    teams = sorted(set(games["home_team"].to_list() + games["away_team"].to_list()))
+    ids = {t: i + 1 for i, t in enumerate(teams)}
+    games = pl.concat([games] * replicate)
+
+    return {
+        "n_teams": len(teams),
+        "N": games.shape[0],
+        "home_teams": [ids[t] for t in games["home_team"].to_list()],
+        "away_teams": [ids[t] for t in games["away_team"].to_list()],
+        "n_games": [1] * games.shape[0],
+        "home_goals": games["home_goals"].to_list(),
+        "away_goals": games["away_goals"].to_list(),
+        "grainsize": grainsize
+    }
+
+
+def run(stan_model, data: dict, threads: int, iters: int, seed: int) -> dict:
+    # One chain, so the timing only reflects within-chain parallelism
+    t0 = time.perf_counter()
+    fit = stan_model.sample(
+        data, chains=1, threads_per_chain=threads, seed=seed,
+        iter_warmup=iters, iter_sampling=iters, show_progress=False
+    )
+    seconds = time.perf_counter() - t0
+    leapfrogs = int(fit.method_variables()["n_leapfrog__"].sum())
+    return {
+        "threads": threads,
+        "seconds": round(seconds, 3),
+        "gradient_us": round(seconds / leapfrogs * 1e6, 2)
+    }
+
+
+if __name__ == "__main__":
+    # Scaling of model_reduce_sum.stan over threads_per_chain, prints one json line per thread count
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--pathtodb", default="data/data.db")
+    parser.add_argument("-s", "--seasons", nargs="+", default=["2023", "2024"])
+    parser.add_argument("-r", "--replicate", type=int, default=1)
+    parser.add_argument("-t", "--threads", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("-g", "--grainsize", type=int, default=model.GRAINSIZE)
+    parser.add_argument("-i", "--iters", type=int, default=500)
+    parser.add_argument("--seed", type=int, default=1)
+
+    args = parser.parse_args()
+    stan_model = model_registry.get_model(
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "model", "model_reduce_sum.stan")
+    )
+    data = multi_season_data(args.pathtodb, args.seasons, args.replicate, args.grainsize)
+
+    baseline = None
+    for threads in args.threads:
+        result = run(stan_model, data, threads, args.iters, args.seed)
+        baseline = baseline or result["seconds"]
+        result["speedup"] = round(baseline / result["seconds"], 2)
+        result["rows"] = data["N"]
+        result["grainsize"] = args.grainsize
+        print(json.dumps(result), flush=True)
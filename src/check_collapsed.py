@@ -0,0 +1,87 @@
+from argparse import ArgumentParser
+from dataclasses import replace
+import json
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import db as db
+import helper as helper
+import model as model
+import model_registry as model_registry
+import posterior_store as posterior_store
+
+
+# Tolerances on each param's posterior, well above the Monte Carlo error of 4000 draws
+MAX_MEAN_DIFF = 0.15   # |mean_a - mean_b| in pooled posterior sds
+MAX_SD_RATIO = 1.15
+
+
+def compare(a: posterior_store.Posterior, b: posterior_store.Posterior) -> dict:
+    # Worst standardized mean difference and sd ratio over every element of PARAM_VARS
+    mean_diff, sd_ratio = 0.0, 1.0
+    for v in posterior_store.PARAM_VARS:
+        xa = a.draws[v].reshape(a.draws[v].shape[0], -1)
+        xb = b.draws[v].reshape(b.draws[v].shape[0], -1)
+        sd_a, sd_b = xa.std(axis=0), xb.std(axis=0)
+        pooled = np.sqrt((sd_a ** 2 + sd_b ** 2) / 2)
+        mean_diff = max(mean_diff, float(np.max(np.abs(xa.mean(axis=0) - xb.mean(axis=0)) / pooled)))
+        sd_ratio = max(sd_ratio, float(np.max(np.maximum(sd_a / sd_b, sd_b / sd_a))))
+
+    return {
+        "max_mean_diff_sd": round(mean_diff, 4),
+        "max_sd_ratio": round(sd_ratio, 4),
+        "equivalent": mean_diff <= MAX_MEAN_DIFF and sd_ratio <= MAX_SD_RATIO
+    }
+
+
+def fit(path_to_db: str, path_to_model: str, max_date: str, season: str, collapsed: bool) -> tuple[posterior_store.Posterior, float]:
+    # Fresh posterior dir per fit so nothing comes from the cache
+    cache_dir = tempfile.mkdtemp(prefix="check_collapsed_")
+    try:
+        # no reduce_sum, whatever STAN_THREADS_PER_CHAIN says, the two likelihoods are what's compared
+        mod = model.GamePredModel(path_to_db, path_to_model, cache_dir, collapsed=collapsed, threads_per_chain=None)
+        # compile (or load) outside of the timing
+        model_registry.get_model(mod.path_to_collapsed_model if collapsed else mod.path_to_model)
+
+        t0 = time.perf_counter()
+        post = mod.get_posterior(max_date, season)
+        seconds = time.perf_counter() - t0
+        # the stored draws are memory-mapped from cache_dir, copy them before it goes
+        return replace(post, draws={v: np.array(post.draws[v]) for v in posterior_store.PARAM_VARS}), seconds
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    # Fits model.stan and model_collapsed.stan on the same games, checks they agree and times both
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--pathtodb", default="data/data.db")
+    parser.add_argument("-m", "--pathtomodel", default="src/model/model.stan")
+    parser.add_argument("-d", "--maxdate", required=True)
+
+    args = parser.parse_args()
+    season = helper.get_nhl_season(args.maxdate)
+
+    with db.get_manager(args.pathtodb).reader() as con:
+        games = db.read_goal_data(con, season, args.maxdate)
+    n_cells = games.select(["home_team", "away_team"]).unique().shape[0]
+
+    per_game, per_game_seconds = fit(args.pathtodb, args.pathtomodel, args.maxdate, season, False)
+    collapsed, collapsed_seconds = fit(args.pathtodb, args.pathtomodel, args.maxdate, season, True)
+
+    result = {
+        "season": season,
+        "max_date": args.maxdate,
+        "games": games.shape[0],
+        "cells": n_cells,
+        "per_game_seconds": round(per_game_seconds, 3),
+        "collapsed_seconds": round(collapsed_seconds, 3),
+        "speedup": round(per_game_seconds / collapsed_seconds, 2),
+        **compare(per_game, collapsed)
+    }
+    print(json.dumps(result))
+    sys.exit(0 if result["equivalent"] else 1)
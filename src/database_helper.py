@@ -10,8 +10,12 @@ import json
 
 import model as model
 import helper as helper 
+import nhl_client as nhl_client
+import db as db
+import backfill as backfill
+import metrics as metrics
 
-def get_reg_goals(date: str):
+def parse_reg_goals(data: dict, date: str):
     def get_reg_goals_single_game(x, d):
         out = {}
         out["date"] = d
@@ -40,13 +44,6 @@ def get_reg_goals(date: str):
 
     
 
-    url = f"https://api-web.nhle.com/v1/score/{date}"
-    try:
-        data = requests.get(url).json()
-    except:
-        print("url not found")
-
-
     out = []
     for game in data["games"]:
         if game["gameType"] == 2 and 'goals' in game.keys():
@@ -55,6 +52,49 @@ def get_reg_goals(date: str):
     return out
 
 
+def get_reg_goals(date: str):
+    try:
+        data = nhl_client.get_client().get_json(f"/v1/score/{date}")
+    except:
+        print("url not found")
+
+    return parse_reg_goals(data, date)
+
+
+@metrics.span("database_helper.get_reg_goals_range")
+def get_reg_goals_range(dates: list[str]) -> list[pl.DataFrame]:
+    # One frame per date, the score requests go out concurrently over the pooled client
+    scores = nhl_client.get_client().get_scores(dates)
+    return [pl.DataFrame(parse_reg_goals(scores[d], d)) for d in dates]
+
+
+@metrics.span("database_helper.register_teams")
+def register_teams(path_to_db: str) -> None:
+    # Keeps the per season team table in step with goal_data, plus every team in the
+    # current standings so ids exist before a team's first game
+    try:
+        standings_teams = helper.get_current_standings()["team"].to_list()
+    except Exception as e:
+        print(e)
+        standings_teams = []
+
+    with db.get_manager(f"{path_to_db}/data.db").writer() as con:
+        db.sync_teams_from_goal_data(con)
+        db.ensure_season_teams(con, helper.get_nhl_season(date.today().strftime("%Y-%m-%d")), standings_teams)
+
+
+@metrics.span("database_helper.predict_slates")
+def predict_slates(mod: model.GamePredModel, dates: list[str]) -> pl.DataFrame | None:
+    # pred_goal_data rows for the regular season games of each date, one posterior per date's slate
+    preds = []
+    for d in dates:
+        games = [g for g in helper.get_game_ids(d)["res"] if str(g["game_id"])[4:6] == '02']
+        if len(games) != 0:
+            preds.append(mod.get_slate_prediction(d, pl.DataFrame(games).select(["game_id", "home_team", "away_team"])))
+
+    return pl.concat(preds, how = "vertical_relaxed") if len(preds) != 0 else None
+
+
 def build_database(start_date: str, path_to_db: str) -> None:
     """
     start_date should be formatted as YYYY-MM-DD    
@@ -64,17 +104,14 @@ def build_database(start_date: str, path_to_db: str) -> None:
     date_range = pl.date_range(start_date, end_date, eager=True).cast(pl.String).alias("date").to_list()
     
     # Getting all the regular season goals for t \in [start_date, today - (1 day)]
-    out = []
-    for d in date_range:
-        out.append(pl.DataFrame(get_reg_goals(d)))
+    out = get_reg_goals_range(date_range)
 
     df = pl.concat(out, how = "diagonal")
 
-    df.write_database(
-        table_name = "goal_data",
-        connection = f"sqlite:///{path_to_db}/data.db",
-        if_table_exists="replace"
-    )
+    with db.get_manager(f"{path_to_db}/data.db").writer() as con:
+        db.clear_goal_data(con)
+        db.insert_goal_data(con, df)
+    register_teams(path_to_db)
 
     # Getting the team parameters and pred goals based on model
     # pred_goal_data = []
@@ -95,51 +132,30 @@ def build_database(start_date: str, path_to_db: str) -> None:
     #             )
     
     # getting predictions for the current day, and next day
-    pred_goal_data = []
     date_range2 = [date.today().strftime("%Y-%m-%d"), (date.today() + timedelta(days = 1)).strftime("%Y-%m-%d")]
-    for d in date_range2:
-        for g in helper.get_game_ids(d)["res"]:
-            if str(g["game_id"])[4:6] == '02':
-                d2 = (date(int(d[0:4]), int(d[5:7]), int(d[8:10])) - timedelta(days=1)).strftime("%Y-%m-%d")
-                out = mod.get_prediction(d2, helper.get_nhl_season(d), g["home_team"], g["away_team"])
-                pred_goal_data.append(
-                    out.pred_table.with_columns(
-                        pl.lit(d).alias("date_of_game"),
-                        pl.lit(g["game_id"]).alias("game_id"),
-                        pl.lit(g["home_team"]).alias("home_team"),
-                        pl.lit(g["away_team"]).alias("away_team"),
-                        pl.lit(out.prob_home_team_win).alias("prob_home_team_win")
-                    )
-                )
-
-    (
-        pl.concat(pred_goal_data, how = "vertical_relaxed")
-        .write_database(
-            table_name = "pred_goal_data",
-            connection = f"sqlite:///{path_to_db}/data.db"
-        )
-    )
+    pred_goal_data = predict_slates(mod, date_range2)
 
-    # Getting latest team parameters
-    (
-        mod.get_team_params()
-        .write_database(
-            table_name = "team_params",
-            connection = f"sqlite:///{path_to_db}/data.db"
-        )
-    )
+    # fresh from the posterior of everything played up to yesterday, get_team_params would return the stored rows
+    yesterday = (date.today() - timedelta(days = 1)).strftime("%Y-%m-%d")
+    with metrics.span("database_helper.team_params"):
+        team_params = mod.get_posterior_team_params(yesterday, helper.get_nhl_season(yesterday))
+    with mod.db.writer() as con:
+        if pred_goal_data is not None:
+            db.replace_pred_goal_data(con, pred_goal_data)
+
+        # Getting latest team parameters
+        db.replace_team_params(con, team_params)
 
     # Getting the season predictions
-    season_proj = mod.get_season_prediction()
+    with metrics.span("database_helper.season_projection"):
+        season_proj = mod.get_season_prediction()
     with open('data/seasons_proj.json', 'w') as f:
         json.dump(season_proj, f)
     
 
 def update_database(path_to_db: str) -> None:
-    con = sqlite3.connect(f"{path_to_db}/data.db")
-    cur = con.cursor()
-    max_date = cur.execute("SELECT MAX(date) FROM goal_data").fetchall()[0][0]
-    con.close()
+    with db.get_manager(f"{path_to_db}/data.db").reader() as con:
+        max_date = db.max_goal_date(con)
 
     max_date = datetime.strptime(max_date, "%Y-%m-%d")
     print(f"Max date in database: {max_date}")
@@ -157,78 +173,44 @@ def update_database(path_to_db: str) -> None:
     print(f"Date range to update: {date_range}")
 
 
-    out = []
-    for d in date_range:
-        print(d)
-        out.append(pl.DataFrame(get_reg_goals(d)))
+    out = get_reg_goals_range(date_range)
     
     if len(out) != 0:
         df = pl.concat(out, how = "diagonal")
-        df.write_database(
-            table_name = "goal_data",
-            connection = f"sqlite:///{path_to_db}/data.db",
-            if_table_exists="append"
-        )
+        with metrics.span("database_helper.insert_goal_data"), db.get_manager(f"{path_to_db}/data.db").writer() as con:
+            db.insert_goal_data(con, df)
+    register_teams(path_to_db)
 
 
 
-    # team_params = []
-    mod = model.GamePredModel(f"{path_to_db}/data.db", "src/model/model.stan")
-    # for d in date_range:
-    #     for g in helper.get_game_ids(d)["res"]:
-    #         if str(g["game_id"])[4:6] == '02':
-    #             print(g["game_id"])
-    #             max_date = date(int(d[0:4]), int(d[5:7]), int(d[8:10])) - timedelta(days = 1)
-    #             out = mod.get_prediction(max_date, helper.get_nhl_season(d), g["home_team"], g["away_team"])
-    #             team_params.append(
-    #                 out.team_params
-    #                 .select(["50%", "team", "type"])
-    #                 .with_columns(
-    #                     pl.lit(d).alias("date_of_pred")
-    #                 )
-    #                 .rename({"50%":"param"})
-    #             )
-    
+    # one more day of games than yesterday's fit, so start from where that fit adapted to
+    mod = model.GamePredModel(f"{path_to_db}/data.db", "src/model/model.stan", warm_start=True)
+
+    # team params history for the newly ingested game dates, the whole season is filled by backfill.py.
+    # The last of these fits is also the posterior today's slate is predicted from.
+    for season in sorted({helper.get_nhl_season(d) for d in date_range}):
+        with metrics.span("database_helper.backfill"):
+            backfill.backfill_season(f"{path_to_db}/data.db", "src/model/model.stan", season, dates=date_range, workers=1)
+
 
     # getting predictions for the current day, and next day
-    pred_goal_data = []
     date_range2 = [date.today().strftime("%Y-%m-%d"), (date.today() + timedelta(days = 1)).strftime("%Y-%m-%d")]
-    for d in date_range2:
-        for g in helper.get_game_ids(d)["res"]:
-            if str(g["game_id"])[4:6] == '02':
-                d2 = (date(int(d[0:4]), int(d[5:7]), int(d[8:10])) - timedelta(days=1)).strftime("%Y-%m-%d")
-                out = mod.get_prediction(d2, helper.get_nhl_season(d), g["home_team"], g["away_team"])
-                pred_goal_data.append(
-                    out.pred_table.with_columns(
-                        pl.lit(d).alias("date_of_game"),
-                        pl.lit(g["game_id"]).alias("game_id"),
-                        pl.lit(g["home_team"]).alias("home_team"),
-                        pl.lit(g["away_team"]).alias("away_team"),
-                        pl.lit(out.prob_home_team_win).alias("prob_home_team_win")
-                    )
-                )
-
-    (
-        pl.concat(pred_goal_data, how = "vertical_relaxed")
-        .write_database(
-            table_name = "pred_goal_data",
-            connection = f"sqlite:///{path_to_db}/data.db",
-            if_table_exists="replace"
-        )
-    )
+    pred_goal_data = predict_slates(mod, date_range2)
 
-    # Getting latest team parameters
-    (
-        mod.get_team_params()
-        .write_database(
-            table_name = "team_params",
-            connection = f"sqlite:///{path_to_db}/data.db",
-            if_table_exists="replace"
-        )
-    )
+    # fresh from the posterior of everything played up to yesterday, get_team_params would return the stored rows
+    yesterday = (date.today() - timedelta(days = 1)).strftime("%Y-%m-%d")
+    with metrics.span("database_helper.team_params"):
+        team_params = mod.get_posterior_team_params(yesterday, helper.get_nhl_season(yesterday))
+    with mod.db.writer() as con:
+        if pred_goal_data is not None:
+            db.replace_pred_goal_data(con, pred_goal_data)
+
+        # Getting latest team parameters
+        db.replace_team_params(con, team_params)
 
     # Getting the season predictions
-    season_proj = mod.get_season_prediction(overwrite=True)
+    with metrics.span("database_helper.season_projection"):
+        season_proj = mod.get_season_prediction(overwrite=True)
     with open('data/seasons_proj.json', 'w') as f:
         json.dump(season_proj, f)
 
@@ -238,6 +220,7 @@ if __name__  == "__main__":
     parser.add_argument("-t", "--type")
     parser.add_argument("-p", "--pathtodb")
     parser.add_argument("-s", "--startdate")
+    parser.add_argument("--metrics", default=None, help="write the run's timings/sampler metrics here in prometheus text format")
 
     args = parser.parse_args()
 
@@ -254,3 +237,7 @@ if __name__  == "__main__":
             update_database(args.pathtodb)
         case _: ValueError("Incorrect argument for type, takes one of 'rebuild' or 'update'")
 
+    if args.metrics is not None:
+        with open(args.metrics, "w") as f:
+            f.write(metrics.render_prometheus())
+
@@ -0,0 +1,424 @@
+from argparse import ArgumentParser
+from contextlib import contextmanager
+import os
+import sqlite3
+import threading
+
+import polars as pl
+
+
+BUSY_TIMEOUT_MS = 30000
+
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS goal_data (
+        id INTEGER PRIMARY KEY,
+        season TEXT NOT NULL,
+        date TEXT NOT NULL,
+        away_team TEXT NOT NULL,
+        home_team TEXT NOT NULL,
+        home_goals INTEGER NOT NULL,
+        away_goals INTEGER NOT NULL,
+        winning_team TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS goal_data_season_date ON goal_data (season, date)",
+    "CREATE INDEX IF NOT EXISTS goal_data_date ON goal_data (date)",
+    """
+    CREATE TABLE IF NOT EXISTS pred_goal_data (
+        game_id INTEGER NOT NULL,
+        date_of_game TEXT NOT NULL,
+        home_team TEXT NOT NULL,
+        away_team TEXT NOT NULL,
+        home INTEGER NOT NULL,
+        away INTEGER NOT NULL,
+        len REAL NOT NULL,
+        prob_home_team_win REAL NOT NULL,
+        PRIMARY KEY (game_id, home, away)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS pred_goal_data_matchup ON pred_goal_data (date_of_game, home_team, away_team)",
+    """
+    CREATE TABLE IF NOT EXISTS team_params (
+        team TEXT NOT NULL,
+        type TEXT NOT NULL,
+        team_id INTEGER NOT NULL,
+        "5%" REAL,
+        "50%" REAL,
+        "95%" REAL,
+        PRIMARY KEY (team, type)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS team_params_history (
+        season TEXT NOT NULL,
+        date TEXT NOT NULL,
+        team TEXT NOT NULL,
+        type TEXT NOT NULL,
+        team_id INTEGER NOT NULL,
+        "5%" REAL,
+        "50%" REAL,
+        "95%" REAL,
+        PRIMARY KEY (season, date, team, type)
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS team_params_history_team ON team_params_history (season, team, date, type)",
+    """
+    CREATE TABLE IF NOT EXISTS teams (
+        season TEXT NOT NULL,
+        team TEXT NOT NULL,
+        id INTEGER NOT NULL,
+        PRIMARY KEY (season, team),
+        UNIQUE (season, id)
+    )
+    """
+]
+
+GOAL_DATA_COLS = ["id", "season", "date", "away_team", "home_team", "home_goals", "away_goals", "winning_team"]
+PRED_GOAL_DATA_COLS = ["game_id", "date_of_game", "home_team", "away_team", "home", "away", "len", "prob_home_team_win"]
+TEAM_PARAMS_COLS = ["team", "type", "team_id", "5%", "50%", "95%"]
+TEAM_PARAMS_HISTORY_COLS = ["season", "date"] + TEAM_PARAMS_COLS
+
+
+class ConnectionManager:
+    """
+    Connections to one sqlite file: a read-only connection per thread for lookups and a
+    single writer connection shared under a lock. The file is put in WAL mode so readers
+    never wait on the writer (including the nightly updater in another process).
+    The write functions below don't commit, everything inside one writer() block is a
+    single transaction.
+    """
+
+    def __init__(self, path_to_db: str, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        self.path_to_db = path_to_db
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        self._readers: list[sqlite3.Connection] = []
+        self._writer: sqlite3.Connection | None = None
+        self._write_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        # creating the schema also creates the file and switches it to WAL
+        with self.writer() as con:
+            init_schema(con)
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        if self._writer is None:
+            con = sqlite3.connect(self.path_to_db, timeout=self.busy_timeout_ms / 1000, check_same_thread=False)
+            con.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+            con.execute("PRAGMA journal_mode = WAL")
+            con.execute("PRAGMA synchronous = NORMAL")
+            self._writer = con
+        return self._writer
+
+    @contextmanager
+    def reader(self):
+        con = getattr(self._local, "con", None)
+        if con is None:
+            uri = f"file:{os.path.abspath(self.path_to_db)}?mode=ro"
+            con = sqlite3.connect(uri, uri=True, timeout=self.busy_timeout_ms / 1000)
+            con.execute(f"PRAGMA busy_timeout = {self.busy_timeout_ms}")
+            self._local.con = con
+            with self._lock:
+                self._readers.append(con)
+        yield con
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            con = self._writer_connection()
+            try:
+                yield con
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            for con in self._readers:
+                con.close()
+            self._readers = []
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+
+_managers: dict[str, ConnectionManager] = {}
+_managers_lock = threading.Lock()
+
+
+def get_manager(path_to_db: str) -> ConnectionManager:
+    # One manager per database file per process
+    key = os.path.abspath(path_to_db)
+    with _managers_lock:
+        if key not in _managers:
+            _managers[key] = ConnectionManager(path_to_db)
+        return _managers[key]
+
+
+def _columns(con: sqlite3.Connection, table: str) -> list[str]:
+    return [r[1] for r in con.execute(f"PRAGMA table_info({table})").fetchall()]
+
+
+def _has_primary_key(con: sqlite3.Connection, table: str) -> bool:
+    return any(r[5] > 0 for r in con.execute(f"PRAGMA table_info({table})").fetchall())
+
+
+def _query_df(con: sqlite3.Connection, query: str, params: tuple = ()) -> pl.DataFrame:
+    cur = con.execute(query, params)
+    cols = [c[0] for c in cur.description]
+    return pl.DataFrame(cur.fetchall(), schema=cols, orient="row")
+
+
+def _quote(cols: list[str]) -> str:
+    return ", ".join(f'"{c}"' for c in cols)
+
+
+def init_schema(con: sqlite3.Connection) -> None:
+    """
+    Creates the tables and indexes, migrating tables written by the old
+    DataFrame.write_database ingest (no keys, no season column) in place.
+    """
+    if table_exists(con, "goal_data") and "season" not in _columns(con, "goal_data"):
+        con.execute("ALTER TABLE goal_data RENAME TO goal_data_old")
+        con.execute(SCHEMA[0])
+        con.execute(f"""
+            INSERT OR REPLACE INTO goal_data ({_quote(GOAL_DATA_COLS)})
+            SELECT id, substr(CAST(id AS TEXT), 1, 4), date, away_team, home_team,
+                   home_goals, away_goals, winning_team
+            FROM goal_data_old
+        """)
+        con.execute("DROP TABLE goal_data_old")
+
+    # derived tables are rebuilt nightly, so unkeyed ones are just dropped
+    for table in ["pred_goal_data", "team_params"]:
+        if table_exists(con, table) and not _has_primary_key(con, table):
+            con.execute(f"DROP TABLE {table}")
+
+    for stmt in SCHEMA:
+        con.execute(stmt)
+
+
+def table_exists(con: sqlite3.Connection, name: str) -> bool:
+    row = con.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = ?", (name,)).fetchone()
+    return row is not None
+
+
+# ---- goal_data ----
+
+def insert_goal_data(con: sqlite3.Connection, df: pl.DataFrame) -> None:
+    # Upsert on game id, so re-ingesting a day is harmless
+    if df.shape[0] == 0:
+        return
+    df = df.with_columns(pl.col("id").cast(pl.String).str.slice(0, 4).alias("season"))
+    con.executemany(
+        f"INSERT OR REPLACE INTO goal_data ({_quote(GOAL_DATA_COLS)}) VALUES ({', '.join('?' * len(GOAL_DATA_COLS))})",
+        df.select(GOAL_DATA_COLS).rows()
+    )
+
+
+def clear_goal_data(con: sqlite3.Connection) -> None:
+    con.execute("DELETE FROM goal_data")
+
+
+def read_goal_data(con: sqlite3.Connection, season: str, max_date: str) -> pl.DataFrame:
+    return _query_df(con, """
+        SELECT date, CAST(id AS TEXT) game_id, away_team,
+               home_team, home_goals, away_goals
+        FROM goal_data
+        WHERE season = ? AND date <= ?
+        ORDER BY id
+    """, (season, max_date))
+
+
+def read_games_on(con: sqlite3.Connection, season: str, date: str) -> pl.DataFrame:
+    # The games played on date with their results
+    return _query_df(con, """
+        SELECT CAST(id AS TEXT) game_id, home_team, away_team,
+               home_goals, away_goals, winning_team
+        FROM goal_data
+        WHERE season = ? AND date = ?
+        ORDER BY id
+    """, (season, date))
+
+
+def max_goal_date(con: sqlite3.Connection) -> str | None:
+    return con.execute("SELECT MAX(date) FROM goal_data").fetchone()[0]
+
+
+def game_dates(con: sqlite3.Connection, season: str) -> list[str]:
+    rows = con.execute("SELECT DISTINCT date FROM goal_data WHERE season = ? ORDER BY date", (season,)).fetchall()
+    return [r[0] for r in rows]
+
+
+# ---- pred_goal_data ----
+
+def replace_pred_goal_data(con: sqlite3.Connection, df: pl.DataFrame) -> None:
+    con.execute("DELETE FROM pred_goal_data")
+    con.executemany(
+        f"INSERT OR REPLACE INTO pred_goal_data ({_quote(PRED_GOAL_DATA_COLS)}) VALUES ({', '.join('?' * len(PRED_GOAL_DATA_COLS))})",
+        df.select(PRED_GOAL_DATA_COLS).rows()
+    )
+
+
+def read_pred_goal_data(con: sqlite3.Connection, date_of_game: str, home_team: str, away_team: str) -> pl.DataFrame:
+    return _query_df(con, """
+        SELECT date_of_game AS date, CAST(game_id AS TEXT) game_id, away_team,
+               home, away, prob_home_team_win, len
+        FROM pred_goal_data
+        WHERE date_of_game = ? AND home_team = ? AND away_team = ?
+        ORDER BY game_id
+    """, (date_of_game, home_team, away_team))
+
+
+# ---- team_params ----
+
+def replace_team_params(con: sqlite3.Connection, df: pl.DataFrame) -> None:
+    con.execute("DELETE FROM team_params")
+    con.executemany(
+        f"INSERT OR REPLACE INTO team_params ({_quote(TEAM_PARAMS_COLS)}) VALUES ({', '.join('?' * len(TEAM_PARAMS_COLS))})",
+        df.select(TEAM_PARAMS_COLS).rows()
+    )
+
+
+def read_team_params(con: sqlite3.Connection) -> pl.DataFrame:
+    return _query_df(con, f"SELECT {_quote(TEAM_PARAMS_COLS)} FROM team_params ORDER BY type, team_id")
+
+
+# ---- team_params_history ----
+
+def insert_team_params_history(con: sqlite3.Connection, season: str, date: str, df: pl.DataFrame) -> None:
+    # Upsert of one date's team params (as written to team_params)
+    df = df.with_columns(pl.lit(season).alias("season"), pl.lit(date).alias("date"))
+    con.executemany(
+        f"INSERT OR REPLACE INTO team_params_history ({_quote(TEAM_PARAMS_HISTORY_COLS)}) VALUES ({', '.join('?' * len(TEAM_PARAMS_HISTORY_COLS))})",
+        df.select(TEAM_PARAMS_HISTORY_COLS).rows()
+    )
+
+
+def team_params_history_dates(con: sqlite3.Connection, season: str) -> set[str]:
+    rows = con.execute("SELECT DISTINCT date FROM team_params_history WHERE season = ?", (season,)).fetchall()
+    return {r[0] for r in rows}
+
+
+def read_team_params_history(con: sqlite3.Connection, season: str, team: str | None = None) -> pl.DataFrame:
+    if team is None:
+        return _query_df(con, f"""
+            SELECT {_quote(TEAM_PARAMS_HISTORY_COLS)} FROM team_params_history
+            WHERE season = ?
+            ORDER BY date, type, team_id
+        """, (season,))
+    return _query_df(con, f"""
+        SELECT {_quote(TEAM_PARAMS_HISTORY_COLS)} FROM team_params_history
+        WHERE season = ? AND team = ?
+        ORDER BY date, type
+    """, (season, team))
+
+
+# ---- teams ----
+
+def ensure_season_teams(con: sqlite3.Connection, season: str, teams: list[str]) -> None:
+    # ids are 1..n_teams in order of first registration and never change. The write lock is taken
+    # before reading the current max id, so two processes can't hand out the same next id
+    if not con.in_transaction:
+        con.execute("BEGIN IMMEDIATE")
+    existing = dict(con.execute("SELECT team, id FROM teams WHERE season = ?", (season,)).fetchall())
+    next_id = max(existing.values(), default=0) + 1
+
+    new_teams = sorted(set(teams) - set(existing.keys()))
+    con.executemany(
+        "INSERT INTO teams (season, team, id) VALUES (?, ?, ?)",
+        [(season, t, next_id + i) for i, t in enumerate(new_teams)]
+    )
+
+
+def sync_teams_from_goal_data(con: sqlite3.Connection) -> None:
+    # Registers every team that appears in goal_data for its season
+    rows = con.execute("""
+        SELECT season, home_team FROM goal_data
+        UNION
+        SELECT season, away_team FROM goal_data
+    """).fetchall()
+
+    by_season = {}
+    for season, team in rows:
+        by_season.setdefault(season, []).append(team)
+
+    for season, teams in by_season.items():
+        ensure_season_teams(con, season, teams)
+
+
+def get_season_teams(con: sqlite3.Connection, season: str) -> pl.DataFrame:
+    rows = con.execute("SELECT team, id FROM teams WHERE season = ? ORDER BY id", (season,)).fetchall()
+    return pl.DataFrame(
+        {"team": [r[0] for r in rows], "id": [r[1] for r in rows]},
+        schema={"team": pl.String, "id": pl.Int32}
+    )
+
+
+# ---- query plans ----
+
+class QueryPlanError(Exception):
+    pass
+
+
+# Hot lookups and the index each one has to use
+PLANNED_QUERIES = [
+    (
+        "SELECT date, id FROM goal_data WHERE season = ? AND date <= ? ORDER BY id",
+        ("2024", "2024-12-01"),
+        "goal_data_season_date"
+    ),
+    (
+        "SELECT home, away FROM pred_goal_data WHERE date_of_game = ? AND home_team = ? AND away_team = ?",
+        ("2024-12-01", "TOR", "BOS"),
+        "pred_goal_data_matchup"
+    ),
+    (
+        "SELECT team, id FROM teams WHERE season = ? ORDER BY id",
+        ("2024",),
+        "sqlite_autoindex_teams"
+    ),
+    (
+        "SELECT MAX(date) FROM goal_data",
+        (),
+        "goal_data_date"
+    ),
+    (
+        'SELECT date, "50%" FROM team_params_history WHERE season = ? AND team = ? ORDER BY date, type',
+        ("2024", "TOR"),
+        "team_params_history_team"
+    )
+]
+
+
+def check_query_plans(con: sqlite3.Connection) -> dict[str, str]:
+    """
+    Runs EXPLAIN QUERY PLAN for PLANNED_QUERIES and raises QueryPlanError if any of them
+    does a full scan instead of using its index. Returns query -> plan.
+    """
+    plans = {}
+    for query, params, index in PLANNED_QUERIES:
+        plan = " | ".join(r[3] for r in con.execute(f"EXPLAIN QUERY PLAN {query}", params).fetchall())
+        plans[query] = plan
+        if index not in plan:
+            raise QueryPlanError(f"{query!r} does not use {index}: {plan}")
+    return plans
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--pathtodb")
+    parser.add_argument("--check-plans", action="store_true")
+
+    args = parser.parse_args()
+
+    manager = get_manager(f"{args.pathtodb}/data.db")
+    if args.check_plans:
+        with manager.reader() as con:
+            for query, plan in check_query_plans(con).items():
+                print(f"{plan}\n    {query}")
+    manager.close()
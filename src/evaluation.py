@@ -0,0 +1,57 @@
+import numpy as np
+import polars as pl
+
+
+# Keeps log loss finite for a (rounded) probability of exactly 0 or 1
+EPS = 1e-12
+
+
+def log_loss(prob: np.ndarray, outcome: np.ndarray) -> float:
+    prob = np.clip(prob, EPS, 1 - EPS)
+    return float(-np.mean(outcome * np.log(prob) + (1 - outcome) * np.log(1 - prob)))
+
+
+def brier(prob: np.ndarray, outcome: np.ndarray) -> float:
+    return float(np.mean((prob - outcome) ** 2))
+
+
+def accuracy(prob: np.ndarray, outcome: np.ndarray) -> float:
+    return float(np.mean((prob > 0.5) == (outcome == 1)))
+
+
+def calibration(prob: np.ndarray, outcome: np.ndarray, bins: int = 10) -> pl.DataFrame:
+    # Predicted vs observed home win rate per equal-width probability bin
+    bin_idx = np.minimum((prob * bins).astype(int), bins - 1)
+    return (
+        pl.DataFrame({"bin": bin_idx, "prob": prob, "outcome": outcome})
+        .group_by("bin")
+        .agg(
+            (pl.col("bin").first() / bins).alias("bin_start"),
+            pl.col("prob").mean().alias("predicted"),
+            pl.col("outcome").mean().alias("observed"),
+            pl.len().alias("games")
+        )
+        .sort("bin")
+        .drop("bin")
+    )
+
+
+def summarize(predictions: pl.DataFrame) -> dict:
+    """
+    Scores walk-forward predictions (prob_home_team_win, home_team_win columns). The expected
+    calibration error is the games-weighted mean |predicted - observed| over the calibration bins.
+    """
+    prob = predictions["prob_home_team_win"].to_numpy()
+    outcome = predictions["home_team_win"].cast(pl.Float64).to_numpy()
+    cal = calibration(prob, outcome)
+
+    return {
+        "games": predictions.shape[0],
+        "log_loss": log_loss(prob, outcome),
+        "brier": brier(prob, outcome),
+        "accuracy": accuracy(prob, outcome),
+        "calibration_error": float(
+            ((cal["predicted"] - cal["observed"]).abs() * cal["games"]).sum() / cal["games"].sum()
+        ),
+        "calibration": cal.to_dicts()
+    }
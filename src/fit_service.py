@@ -0,0 +1,135 @@
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+
+from starlette.concurrency import run_in_threadpool
+
+import metrics as metrics
+import model as model
+import posterior_store as posterior_store
+
+
+FIT_WORKERS = int(os.environ.get("FIT_WORKERS", "2"))
+
+# GamePredModel per worker process, so the loaded stan model is reused between tasks
+_worker_models: dict[tuple, model.GamePredModel] = {}
+
+
+ITERATION_RE = re.compile(r"Iteration:\s*(\d+)\s*/\s*(\d+)")
+
+
+def spawn_pool(max_workers: int) -> ProcessPoolExecutor:
+    # spawn, forking a process that holds sqlite connections, threads or a running event loop isn't safe
+    return ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context("spawn"))
+
+
+def worker_model(path_to_db: str, path_to_model: str, path_to_posteriors: str | None, options: dict, private_season: str | None = None) -> model.GamePredModel:
+    """
+    The pool worker's GamePredModel for these arguments (options are GamePredModel.fit_options()).
+    With private_season, its warm starts chain through a private copy of that season's adaptation,
+    so fits of past dates don't overwrite the one the nightly fit starts from.
+    """
+    key = (path_to_db, path_to_model, path_to_posteriors, tuple(sorted(options.items())), private_season)
+    if key not in _worker_models:
+        mod = model.GamePredModel(path_to_db, path_to_model, path_to_posteriors, **options)
+        if private_season is not None:
+            mod.adaptations = mod.adaptations.fork(private_season, tempfile.mkdtemp(prefix=f"adaptation_{private_season}_"))
+        _worker_models[key] = mod
+    return _worker_models[key]
+
+
+def _fit_posterior(path_to_db: str, path_to_model: str, path_to_posteriors: str, options: dict, max_date: str, season: str, output_dir: str, mode: str) -> tuple[posterior_store.Posterior, dict, list]:
+    # Runs inside a pool worker. The posterior is persisted there and comes back as a reference to its
+    # memory-mapped files, along with the worker's metrics and spans for the parent to merge.
+    mod = worker_model(path_to_db, path_to_model, path_to_posteriors, options)
+    with metrics.profile() as spans:
+        post = mod.get_posterior(max_date, season, output_dir=output_dir, mode=mode)
+    return post, metrics.drain(), spans
+
+
+def sampler_progress(output_dir: str) -> float:
+    # Fraction of iterations (warmup included) done, averaged over chains, from cmdstan's console output
+    fractions = []
+    for f in glob.glob(os.path.join(output_dir, "*-stdout.txt")):
+        with open(f, "r") as fh:
+            matches = ITERATION_RE.findall(fh.read())
+        if len(matches) > 0:
+            done, total = matches[-1]
+            fractions.append(int(done) / int(total))
+    return sum(fractions) / len(fractions) if len(fractions) > 0 else 0.0
+
+
+class FitService:
+    """
+    Runs stan fits for a GamePredModel in a bounded process pool so async handlers can
+    await them without blocking the event loop. Concurrent requests for the same
+    (season, max_date, mode) share one in-flight fit.
+    """
+
+    def __init__(self, mod: model.GamePredModel, max_workers: int = FIT_WORKERS):
+        self.mod = mod
+        self.max_workers = max_workers
+        self._pool = None
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._output_dirs: dict[tuple, str] = {}
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            self._pool = spawn_pool(self.max_workers)
+        return self._pool
+
+    async def posterior(self, max_date: str, season: str, mode: str = "sample") -> posterior_store.Posterior:
+        post = await run_in_threadpool(self.mod.get_posterior, max_date, season, False, None, mode)
+        if post is not None:
+            return post
+
+        # the fit runs as its own task, so a cancelled caller (disconnect, timeout) doesn't take it
+        # down for the others awaiting it
+        key = (season, max_date, mode)
+        if key not in self._inflight:
+            task = asyncio.ensure_future(self._fit(max_date, season, mode))
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())  # retrieved even if nobody awaits it anymore
+            self._inflight[key] = task
+        return await asyncio.shield(self._inflight[key])
+
+    async def _fit(self, max_date: str, season: str, mode: str) -> posterior_store.Posterior:
+        key = (season, max_date, mode)
+        loop = asyncio.get_running_loop()
+        output_dir = tempfile.mkdtemp(prefix=f"fit_{season}_{max_date}_{mode}_")
+        self._output_dirs[key] = output_dir
+        try:
+            post, worker_metrics, spans = await loop.run_in_executor(
+                self._get_pool(),
+                _fit_posterior,
+                self.mod.path_to_db,
+                self.mod.path_to_model,
+                self.mod.posterior_store.cache_dir,
+                self.mod.fit_options(),
+                max_date,
+                season,
+                output_dir,
+                mode
+            )
+            metrics.merge(worker_metrics, spans)
+            self.mod.posterior_store.put(post, persist=False)
+            return post
+        finally:
+            del self._inflight[key]
+            del self._output_dirs[key]
+            # the draws live in the posterior store, cmdstan's csv files aren't needed anymore
+            shutil.rmtree(output_dir, ignore_errors=True)
+
+    def progress(self, max_date: str, season: str, mode: str = "sample") -> float | None:
+        # Sampler progress of the in-flight fit for (season, max_date, mode), None if there is none
+        output_dir = self._output_dirs.get((season, max_date, mode))
+        return sampler_progress(output_dir) if output_dir is not None else None
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
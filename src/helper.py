@@ -4,32 +4,13 @@ import cmdstanpy
 import sqlite3
 import requests
 
-def get_all_teams() -> pl.DataFrame:
-    # TODO: figure out a better way to get all the teams for a specific season
-    url = f"https://api-web.nhle.com/v1/standings/now"
-
-    try:
-        data = requests.get(url).json()
-    except:
-        print("url not found")
-
-    out = (
-        pl.DataFrame({
-            "team": list(map(lambda x: x["teamAbbrev"]["default"], data["standings"]))
-        })
-        .with_columns(
-            pl.arange(1, pl.len()+1).alias("id")
-        )
-    )
-
-    return out
-
+import nhl_client as nhl_client
+import metrics as metrics
 
+@metrics.span("helper.get_game_ids")
 def get_game_ids(date: str):
-    url = f"https://api-web.nhle.com/v1/schedule/{date}"
-    
     try:
-        data = requests.get(url).json()
+        data = nhl_client.get_client().get_json(f"/v1/schedule/{date}")
     except Exception as e:
         print(e)
         return [{}]
@@ -49,11 +30,10 @@ def get_game_ids(date: str):
     return {'res': out}
 
 
+@metrics.span("helper.get_current_standings")
 def get_current_standings() -> pl.DataFrame:
-    url = f"https://api-web.nhle.com/v1/standings/now"
-
     try:
-        data = requests.get(url).json()
+        data = nhl_client.get_client().get_json("/v1/standings/now")
     except:
         print("url not found")
 
@@ -63,7 +43,9 @@ def get_current_standings() -> pl.DataFrame:
             "wins": list(map(lambda x: x["wins"], data["standings"])),
             "losses": list(map(lambda x: x["losses"], data["standings"])),
             "ot_losses": list(map(lambda x: x["otLosses"], data["standings"])),
-            "points": list(map(lambda x: x["points"], data["standings"]))
+            "points": list(map(lambda x: x["points"], data["standings"])),
+            "conference": list(map(lambda x: x["conferenceAbbrev"], data["standings"])),
+            "division": list(map(lambda x: x["divisionAbbrev"], data["standings"]))
         })
         .with_columns(
             pl.arange(1, pl.len()+1).alias("id")
@@ -74,20 +56,10 @@ def get_current_standings() -> pl.DataFrame:
     return out
 
 
+@metrics.span("helper.get_reg_scheduled_games")
 def get_reg_scheduled_games(first_date: str, last_date: str) -> pl.DataFrame:
     # dates should be formatted as YYYY-MM-DD
 
-    date_range = (
-        pl
-        .date_range(
-            datetime.strptime(first_date, "%Y-%m-%d"), 
-            datetime.strptime(last_date, "%Y-%m-%d"), 
-            eager=True
-        )
-        .cast(pl.String)
-        .alias("date").to_list()
-    )
-
     out = {
         "date": [],
         "id": [],
@@ -95,17 +67,16 @@ def get_reg_scheduled_games(first_date: str, last_date: str) -> pl.DataFrame:
         "away_team": []
     }
 
-    for d in date_range:
-        url = f"https://api-web.nhle.com/v1/schedule/{d}"
-        try:
-            data = requests.get(url).json()
-        except:
-            print("url not found")
-        
-        # for game_date in data["gameWeek"]:
-        for g in data["gameWeek"][0]["games"]:
+    try:
+        game_days = nhl_client.get_client().get_schedule(first_date, last_date)
+    except:
+        print("url not found")
+        game_days = []
+
+    for game_date in game_days:
+        for g in game_date["games"]:
             if g["gameType"] == 2:
-                out["date"].append(d)
+                out["date"].append(game_date["date"])
                 out["id"].append(g["id"])
                 out["away_team"].append(g["awayTeam"]["abbrev"])
                 out["home_team"].append(g["homeTeam"]["abbrev"])
@@ -122,16 +93,15 @@ def get_nhl_season(date_str: str) -> str:
         return f"{year - 1}"
 
 
+@metrics.span("helper.get_season_start_end_dates")
 def get_season_start_end_dates(season: str) -> dict:
-    url = f"https://api.nhle.com/stats/rest/en/season"
-
     try:
-        data = requests.get(url).json()
+        data = nhl_client.get_client().get_json("/stats/rest/en/season", stats_api=True)
     except Exception as e:
         print(e)
         return {}
     
-    season_info = list(filter(lambda x: x["id"] == f"{season}{str(int(season)+1)}", data["data"]))
+    season_info = list(filter(lambda x: str(x["id"]) == f"{season}{str(int(season)+1)}", data["data"]))
 
     if len(season_info) == 0:
         return {}
@@ -0,0 +1,114 @@
+import asyncio
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import json
+import time
+import uuid
+
+
+@dataclass
+class Job:
+    id: str
+    kind: str
+    params: dict
+    status: str = "queued"     # queued -> running -> done | failed
+    stage: str = "queued"
+    progress: float = 0.0
+    result: dict | list | None = None
+    error: str | None = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_dict(self, with_result: bool = True) -> dict:
+        out = {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 4),
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+        if with_result:
+            out["result"] = self.result
+        return out
+
+
+class JobStore:
+    """
+    In-memory store of prediction jobs. Listeners await changes to a job through
+    wait_for_change, finished jobs beyond max_jobs are evicted oldest first.
+    """
+
+    def __init__(self, max_jobs: int = 256):
+        self.max_jobs = max_jobs
+        self._jobs: OrderedDict[str, Job] = OrderedDict()
+        self._changed: dict[str, asyncio.Event] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def get(self, job_id: str) -> Job | None:
+        return self._jobs.get(job_id)
+
+    def update(self, job: Job, **fields) -> None:
+        for k, v in fields.items():
+            setattr(job, k, v)
+        job.updated_at = time.time()
+
+        # wake everyone waiting on the job, then arm a fresh event
+        self._changed[job.id].set()
+        self._changed[job.id] = asyncio.Event()
+
+    def submit(self, kind: str, params: dict, run) -> Job:
+        """
+        Creates a job and schedules run(job) on the running loop. run is an async callable
+        that returns the job's result and may call update() to report its stage/progress.
+        """
+        job = Job(uuid.uuid4().hex, kind, params)
+        self._jobs[job.id] = job
+        self._changed[job.id] = asyncio.Event()
+        self._evict()
+
+        async def runner():
+            self.update(job, status="running", stage="starting")
+            try:
+                result = await run(job)
+                self.update(job, status="done", stage="done", progress=1.0, result=result)
+            except Exception as e:
+                self.update(job, status="failed", stage="failed", error=repr(e))
+            finally:
+                self._tasks.pop(job.id, None)
+
+        self._tasks[job.id] = asyncio.create_task(runner())
+        return job
+
+    async def wait_for_change(self, job: Job, timeout: float) -> None:
+        try:
+            await asyncio.wait_for(self._changed[job.id].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _evict(self) -> None:
+        finished = [j.id for j in self._jobs.values() if j.status in ("done", "failed")]
+        while len(self._jobs) > self.max_jobs and len(finished) > 0:
+            job_id = finished.pop(0)
+            del self._jobs[job_id]
+            del self._changed[job_id]
+
+
+def sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_events(store: JobStore, job: Job, heartbeat: float = 15.0):
+    # Server-sent events: "progress" on every change, then a final "result" or "error"
+    yield sse("progress", job.to_dict(with_result=False))
+    while job.status not in ("done", "failed"):
+        await store.wait_for_change(job, heartbeat)
+        yield sse("progress", job.to_dict(with_result=False))
+
+    if job.status == "done":
+        yield sse("result", job.to_dict())
+    else:
+        yield sse("error", job.to_dict(with_result=False))
@@ -0,0 +1,146 @@
+from collections import defaultdict
+from contextlib import contextmanager
+import contextvars
+import threading
+import time
+
+
+# Process-wide counters/gauges/timings, keyed by (name, sorted label items)
+_lock = threading.Lock()
+_counters: dict[tuple, float] = defaultdict(float)
+_gauges: dict[tuple, float] = {}
+_timings: dict[tuple, list[float]] = defaultdict(lambda: [0.0, 0])
+
+# spans of the request being profiled, see profile()
+_profile: contextvars.ContextVar[list | None] = contextvars.ContextVar("profile", default=None)
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+
+def inc(name: str, value: float = 1, **labels) -> None:
+    with _lock:
+        _counters[_key(name, labels)] += value
+
+
+def set_gauge(name: str, value: float, **labels) -> None:
+    with _lock:
+        _gauges[_key(name, labels)] = value
+
+
+def observe(name: str, seconds: float, **labels) -> None:
+    # keeps a running sum/count so averages can be derived
+    with _lock:
+        t = _timings[_key(name, labels)]
+        t[0] += seconds
+        t[1] += 1
+
+
+def snapshot() -> dict:
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {k: tuple(v) for k, v in _timings.items()}
+        }
+
+
+@contextmanager
+def span(name: str, **labels):
+    # Times a stage into span_seconds{span=name}, and into the current profile when one is active
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - t0
+        observe("span_seconds", seconds, span=name, **labels)
+        spans = _profile.get()
+        if spans is not None:
+            spans.append((name, seconds))
+
+
+@contextmanager
+def profile():
+    # Collects the (span, seconds) of everything run in this context, threadpool calls included
+    spans = []
+    token = _profile.set(spans)
+    try:
+        yield spans
+    finally:
+        _profile.reset(token)
+
+
+def drain() -> dict:
+    # snapshot() and reset, e.g. for a pool worker to hand its metrics to the parent
+    with _lock:
+        out = {
+            "counters": dict(_counters),
+            "gauges": dict(_gauges),
+            "timings": {k: tuple(v) for k, v in _timings.items()}
+        }
+        _counters.clear()
+        _gauges.clear()
+        _timings.clear()
+    return out
+
+
+def merge(drained: dict, spans: list[tuple[str, float]] | None = None) -> None:
+    # Folds a worker's drain() (and profile spans) into this process
+    with _lock:
+        for k, v in drained["counters"].items():
+            _counters[k] += v
+        _gauges.update(drained["gauges"])
+        for k, (total, count) in drained["timings"].items():
+            t = _timings[k]
+            t[0] += total
+            t[1] += count
+    current = _profile.get()
+    if current is not None and spans is not None:
+        current.extend(spans)
+
+
+def _labels(labels: tuple) -> str:
+    if len(labels) == 0:
+        return ""
+    escape = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escape(v)}"' for k, v in labels) + "}"
+
+
+def hit_ratios(counters: dict) -> dict:
+    # <prefix>_hit_ratio for every <prefix>_hits_total/<prefix>_misses_total pair with the same labels
+    ratios = {}
+    for (name, labels) in counters:
+        for suffix in ["_hits_total", "_misses_total"]:
+            if name.endswith(suffix):
+                prefix = name[:-len(suffix)]
+                hits = counters.get((f"{prefix}_hits_total", labels), 0.0)
+                misses = counters.get((f"{prefix}_misses_total", labels), 0.0)
+                ratios[(f"{prefix}_hit_ratio", labels)] = hits / (hits + misses)
+    return ratios
+
+
+def render_prometheus() -> str:
+    """
+    Prometheus text exposition of the snapshot: counters and gauges as is, timings as summaries
+    (<name>_sum, <name>_count) and derived cache hit ratios as gauges.
+    """
+    snap = snapshot()
+    gauges = {**snap["gauges"], **hit_ratios(snap["counters"])}
+
+    lines = []
+    def family(values: dict, kind: str) -> None:
+        for name in sorted({k[0] for k in values}):
+            lines.append(f"# TYPE {name} {kind}")
+            for (n, labels), v in sorted(values.items()):
+                if n == name:
+                    if kind == "summary":
+                        lines.append(f"{name}_sum{_labels(labels)} {v[0]}")
+                        lines.append(f"{name}_count{_labels(labels)} {v[1]}")
+                    else:
+                        lines.append(f"{name}{_labels(labels)} {v}")
+
+    family(snap["counters"], "counter")
+    family(gauges, "gauge")
+    family(snap["timings"], "summary")
+    return "\n".join(lines) + "\n"
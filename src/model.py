@@ -10,52 +10,174 @@ import os
 import json
 
 import helper as helper
+import db as db
+import posterior_store as posterior_store
+import posterior_summary as posterior_summary
+import model_registry as model_registry
+import simulation as simulation
+import adaptation as adaptation
+import metrics as metrics
+import evaluation as evaluation
 # import helper as helper
 
 
+# Inference algorithms a posterior can be fit with, all of them give draws of the same params
+INFERENCE_MODES = ["sample", "laplace", "pathfinder", "variational"]
+
+# Draws taken by the approximate modes, as many as the 4 NUTS chains give
+APPROX_DRAWS = 4000
+
+# Defaults for reduce_sum fits, e.g. STAN_THREADS_PER_CHAIN=4 runs the 4 chains on 16 cores.
+# Unset keeps the single-threaded likelihood.
+THREADS_PER_CHAIN = int(os.environ["STAN_THREADS_PER_CHAIN"]) if os.environ.get("STAN_THREADS_PER_CHAIN") else None
+GRAINSIZE = int(os.environ.get("STAN_GRAINSIZE", "1"))
+
+# Seed of the NumPy series/season simulations. Unset seeds them from the posterior's key
+# (simulation.posterior_rng), so repeated requests on a cached posterior agree.
+SIM_SEED = int(os.environ["SIM_SEED"]) if os.environ.get("SIM_SEED") else None
+
+
 @dataclass
 class DataModel:
     model_df: pl.DataFrame
     team_id_map: pl.DataFrame
-
-@dataclass
-class ModelResult:
-    model: cmdstanpy.CmdStanMCMC 
-    model_data: DataModel
+    # games aggregated per (home_id, away_id): n_games and home/away goal totals
+    cell_df: pl.DataFrame
 
 @dataclass
 class PredResult:
     pred_table: pl.DataFrame
     prob_home_team_win: pl.DataFrame
     team_params: pl.DataFrame
+    # regulation/OT/shootout win probs, see simulation.ScoreGrid.outcomes (not kept for stored predictions)
+    outcome_probs: dict | None = None
+
+@dataclass
+class SeriesPredResult:
+    outcomes: pl.DataFrame
+    series_length: pl.DataFrame
+    winner: pl.DataFrame
+
+
+def collapsed_training_data(dat: DataModel) -> dict:
+    # Data block of model_collapsed.stan
+    return {
+        "n_teams": dat.team_id_map.shape[0],
+        "K": dat.cell_df.shape[0],
+        "home_teams": dat.cell_df["home_id"].to_list(),
+        "away_teams": dat.cell_df["away_id"].to_list(),
+        "n_games": dat.cell_df["n_games"].to_list(),
+        "home_goals": dat.cell_df["home_goals"].to_list(),
+        "away_goals": dat.cell_df["away_goals"].to_list()
+    }
+
+
+def walk_forward_dates(con: sqlite3.Connection, season: str, start_date: str | None, end_date: str | None) -> list[str]:
+    # Game dates of season in [start_date, end_date], either bound optional
+    return [
+        d for d in db.game_dates(con, season)
+        if (start_date is None or d >= start_date) and (end_date is None or d <= end_date)
+    ]
+
+
+def reduce_sum_training_data(dat: DataModel, collapsed: bool, grainsize: int) -> dict:
+    # Data block of model_reduce_sum.stan, one row per cell when collapsed, otherwise per game
+    rows = dat.cell_df if collapsed else dat.model_df.with_columns(pl.lit(1).alias("n_games"))
+    return {
+        "n_teams": dat.team_id_map.shape[0],
+        "N": rows.shape[0],
+        "home_teams": rows["home_id"].to_list(),
+        "away_teams": rows["away_id"].to_list(),
+        "n_games": rows["n_games"].to_list(),
+        "home_goals": rows["home_goals"].to_list(),
+        "away_goals": rows["away_goals"].to_list(),
+        "grainsize": grainsize
+    }
+
+
+def record_sampler_metrics(model_fit: cmdstanpy.CmdStanMCMC, start: str) -> None:
+    # Warmup/sampling time (slowest chain), divergences, max treedepth hits and min ESS per second of a NUTS fit
+    warmup = max(t["warmup"] for t in model_fit.time)
+    sampling = max(t["sampling"] for t in model_fit.time)
+    min_ess = float(np.min(adaptation.ess(adaptation.sampled_draws(model_fit))))
+
+    metrics.observe("stan_warmup_seconds", warmup, start=start)
+    metrics.observe("stan_sampling_seconds", sampling, start=start)
+    metrics.inc("stan_divergences_total", int(np.sum(model_fit.divergences)), start=start)
+    metrics.inc("stan_max_treedepth_transitions_total", int(np.sum(model_fit.max_treedepths)), start=start)
+    metrics.set_gauge("stan_min_ess", min_ess)
+    metrics.set_gauge("stan_min_ess_per_second", min_ess / max(warmup + sampling, 1e-9))
+
+
+def grid_table(grid: simulation.ScoreGrid) -> pl.DataFrame:
+    # One row per regulation scoreline, len is its probability in %
+    goals = np.arange(grid.probs.shape[0])
+    return pl.DataFrame({
+        "home": np.repeat(goals, goals.shape[0]),
+        "away": np.tile(goals, goals.shape[0]),
+        "len": grid.probs.ravel() * 100
+    })
 
 
 class GamePredModel:
     
-    def __init__(self, path_to_db, path_to_model):
+    def __init__(self, path_to_db, path_to_model, path_to_posteriors = None, warm_start = False, collapsed = False,
+                 threads_per_chain = THREADS_PER_CHAIN, grainsize = GRAINSIZE, seed = SIM_SEED):
         self.path_to_db = path_to_db
         self.path_to_model = path_to_model
+        # warm start fits from the season's previous adaptation, see __sample
+        self.warm_start = warm_start
+        # fit posteriors with the per-cell likelihood of model_collapsed.stan, same posterior at O(n_teams^2) cost
+        self.collapsed = collapsed
+        self.path_to_collapsed_model = os.path.join(os.path.dirname(path_to_model), "model_collapsed.stan")
+        # with threads_per_chain, NUTS fits use model_reduce_sum.stan to split the likelihood over that
+        # many threads per chain, in slices of about grainsize rows (games, or cells when collapsed)
+        self.threads_per_chain = threads_per_chain
+        self.grainsize = grainsize
+        self.path_to_reduce_sum_model = os.path.join(os.path.dirname(path_to_model), "model_reduce_sum.stan")
+        # matchups are simulated from the stored draws (simulation.py), fits only give team params
+        self.seed = seed
+
+        if path_to_posteriors is None:
+            path_to_posteriors = os.path.join(os.path.dirname(path_to_db), "posteriors")
+        self.posterior_store = posterior_store.PosteriorStore(path_to_posteriors)
+        self.adaptations = adaptation.AdaptationStore(path_to_posteriors)
+        self.db = db.get_manager(self.path_to_db)
+
+
+    def fit_options(self) -> dict:
+        # Constructor options that change how posteriors are fit, e.g. to rebuild the model in a worker
+        return {
+            "warm_start": self.warm_start,
+            "collapsed": self.collapsed,
+            "threads_per_chain": self.threads_per_chain,
+            "grainsize": self.grainsize
+        }
 
 
     def __get_model_data(self, max_date: str, season: str) -> DataModel:
-        con = sqlite3.connect(self.path_to_db) 
-        query = f"""
-            SELECT date, CAST(id as text) game_id, away_team, 
-                    home_team, home_goals, away_goals
-            FROM goal_data
-            WHERE date <= "{max_date}" AND substr(game_id, 1, 4) == "{season}"
-            ORDER BY game_id
-        """
-        out = (
-            pl.read_database(query=query, connection=con)
-        )
+        with metrics.span("model.read_goal_data"), self.db.reader() as con:
+            out = db.read_goal_data(con, season, max_date)
+            team_id_map = db.get_season_teams(con, season)
 
         if out.shape[0] == 0:
             raise IndexError("No Data Found")
 
-        team_id_map = helper.get_all_teams()
+        # stable per season ids from the local team table, registering any team it doesn't know yet
+        seen_teams = set(out["home_team"].to_list() + out["away_team"].to_list())
+        if not seen_teams.issubset(set(team_id_map["team"].to_list())):
+            with self.db.writer() as con:
+                db.ensure_season_teams(con, season, list(seen_teams))
+                team_id_map = db.get_season_teams(con, season)
 
         # Join out with team_id_map for home and away teams
+        with metrics.span("model.prepare_data"):
+            out, cells = self.__join_team_ids(out, team_id_map)
+
+        return DataModel(out, team_id_map, cells)
+
+
+    def __join_team_ids(self, out: pl.DataFrame, team_id_map: pl.DataFrame) -> tuple[pl.DataFrame, pl.DataFrame]:
         out = (
             out
             .join(
@@ -70,318 +192,371 @@ class GamePredModel:
             )
         )
 
-        return DataModel(
-            out, 
-            team_id_map.with_columns(pl.col("id").cast(pl.Int32))   
+        cells = (
+            out
+            .group_by(["home_id", "away_id"])
+            .agg(
+                pl.len().alias("n_games"),
+                pl.col("home_goals").sum(),
+                pl.col("away_goals").sum()
+            )
+            .sort(["home_id", "away_id"])
         )
 
+        return out, cells
 
-    def __fit_model(self, max_date: str, season: str, home_team: str, away_team: str) -> ModelResult:
-        # Loading stan model from file
-        model = cmdstanpy.CmdStanModel(stan_file = self.path_to_model)
 
-        dat = self.__get_model_data(max_date, season)
-        training_data = {
-            "N": dat.model_df.shape[0],
-            "n_teams": dat.team_id_map.shape[0],
-            "home_teams": dat.model_df["home_id"].to_list(),
-            "away_teams": dat.model_df["away_id"].to_list(),
-            "home_goals": dat.model_df["home_goals"].to_list(),
-            "away_goals": dat.model_df["away_goals"].to_list(),
-            "home_new": dat.team_id_map.filter(pl.col("team") == home_team)["id"].to_list(),
-            "away_new": dat.team_id_map.filter(pl.col("team") == away_team)["id"].to_list(),
-            "N_new": 1
-        }
+    def __sample(self, model: cmdstanpy.CmdStanModel, training_data: dict, season: str, max_date: str, output_dir: str | None) -> cmdstanpy.CmdStanMCMC:
+        # With warm_start, starts from the previous fit's step size, metric and posterior means with a
+        # short warmup, and falls back to a cold fit if the diagnostics got worse than that fit's
+        prev = self.adaptations.get(season, training_data["n_teams"]) if self.warm_start else None
 
-        # Fitting model
-        model_fit = model.sample(training_data, parallel_chains=4)
+        model_fit, diagnostics = None, None
+        if prev is not None:
+            with metrics.span("model.sample", start="warm"):
+                model_fit = model.sample(
+                    training_data, parallel_chains=4, threads_per_chain=self.threads_per_chain,
+                    output_dir=output_dir, **prev.sample_args()
+                )
+            with metrics.span("model.diagnostics"):
+                diagnostics = adaptation.diagnose(model_fit)
+            record_sampler_metrics(model_fit, "warm")
+            if adaptation.degraded(diagnostics, prev):
+                metrics.inc("stan_warm_start_total", outcome="fallback")
+                model_fit, diagnostics = None, None
+            else:
+                metrics.inc("stan_warm_start_total", outcome="accepted")
+
+        if model_fit is None:
+            with metrics.span("model.sample", start="cold"):
+                model_fit = model.sample(
+                    training_data, parallel_chains=4, threads_per_chain=self.threads_per_chain, output_dir=output_dir
+                )
+            record_sampler_metrics(model_fit, "cold")
 
-        return ModelResult(model_fit, dat)
+        with metrics.span("model.diagnostics"):
+            self.adaptations.put(adaptation.from_fit(model_fit, season, max_date, training_data["n_teams"], diagnostics))
+        return model_fit
 
 
-    def __fit_model_multiple_preds(self, max_date: str, season: str, home_teams: list[str], away_teams: list[str]) -> ModelResult:
-        if len(home_teams) != len(away_teams):
-            raise IndexError("len(home_teams) != len(away_teams)") 
+    def __approximate(self, model: cmdstanpy.CmdStanModel, training_data: dict, output_dir: str | None, mode: str) -> dict[str, np.ndarray]:
+        # Laplace around the posterior mode, Pathfinder or ADVI, each returning APPROX_DRAWS draws
+        with metrics.span("model.approximate", mode=mode):
+            if mode == "laplace":
+                model_fit = model.laplace_sample(training_data, draws=APPROX_DRAWS, output_dir=output_dir)
+            elif mode == "pathfinder":
+                model_fit = model.pathfinder(training_data, draws=APPROX_DRAWS, output_dir=output_dir)
+            else:
+                model_fit = model.variational(training_data, draws=APPROX_DRAWS, output_dir=output_dir)
 
+        # ADVI's stan_variable defaults to the mean
+        draw_args = {"mean": False} if mode == "variational" else {}
+        with metrics.span("model.read_draws", mode=mode):
+            return {v: model_fit.stan_variable(v, **draw_args) for v in posterior_store.PARAM_VARS}
 
-        # Loading stan model from file
-        model = cmdstanpy.CmdStanModel(stan_file = self.path_to_model)
+
+    def get_posterior(self, max_date: str, season: str, fit: bool = True, output_dir: str | None = None, mode: str = "sample") -> posterior_store.Posterior | None:
+        # The team params only depend on the training rows, so one fit answers every matchup.
+        # With fit=False only stored posteriors are returned, None otherwise.
+        # output_dir is where cmdstan writes its csv/console files, see fit_service.sampler_progress
+        if mode not in INFERENCE_MODES:
+            raise ValueError(f"Unknown inference mode {mode}, expected one of {INFERENCE_MODES}")
 
         dat = self.__get_model_data(max_date, season)
-        training_data = {
-            "N": dat.model_df.shape[0], 
-            "n_teams": dat.team_id_map.shape[0],
-            "home_teams": dat.model_df["home_id"].to_list(),
-            "away_teams": dat.model_df["away_id"].to_list(),
-            "home_goals": dat.model_df["home_goals"].to_list(),
-            "away_goals": dat.model_df["away_goals"].to_list(),
-            "home_new": (pl.DataFrame({"team": home_teams})
-                         .join(dat.team_id_map, on = "team", how = "left")["id"].to_list()),
-            "away_new": (pl.DataFrame({"team": away_teams})
-                         .join(dat.team_id_map, on = "team", how = "left")["id"].to_list()),
-            "N_new": len(home_teams)
-        }
+        # keyed by the last game actually trained on, any later max_date reuses the same fit
+        max_date = dat.model_df["date"].max()
+        with metrics.span("model.fingerprint"):
+            fp = posterior_store.fingerprint(dat.model_df, dat.team_id_map)
+
+        post = self.posterior_store.get(season, max_date, fp, mode)
+        if post is not None or not fit:
+            return post
+        metrics.inc("posterior_cache_misses_total")
+
+        # Loading the compiled stan model
+        if self.threads_per_chain is not None and mode == "sample":
+            path_to_model = self.path_to_reduce_sum_model
+            training_data = reduce_sum_training_data(dat, self.collapsed, self.grainsize)
+        elif self.collapsed:
+            path_to_model = self.path_to_collapsed_model
+            training_data = collapsed_training_data(dat)
+        else:
+            path_to_model = self.path_to_model
+            training_data = {
+                "N": dat.model_df.shape[0],
+                "n_teams": dat.team_id_map.shape[0],
+                "home_teams": dat.model_df["home_id"].to_list(),
+                "away_teams": dat.model_df["away_id"].to_list(),
+                "home_goals": dat.model_df["home_goals"].to_list(),
+                "away_goals": dat.model_df["away_goals"].to_list()
+            }
+
+        with metrics.span("model.load_model"):
+            model = model_registry.get_model(path_to_model)
 
         # Fitting model
-        model_fit = model.sample(training_data, parallel_chains=4)
+        if mode == "sample":
+            model_fit = self.__sample(model, training_data, season, max_date, output_dir)
+            with metrics.span("model.read_draws", mode=mode):
+                draws = {v: model_fit.stan_variable(v) for v in posterior_store.PARAM_VARS}
+            chains = model_fit.chains
+        else:
+            draws = self.__approximate(model, training_data, output_dir, mode)
+            chains = 1
 
-        return ModelResult(model_fit, dat)
+        post = posterior_store.Posterior(season, max_date, fp, draws, dat.team_id_map, mode, chains)
+        # from here on the draws are memory-mapped from the store
+        with metrics.span("model.store_posterior"):
+            post = self.posterior_store.put(post)
 
+        return post
 
-    def __get_params(self, model: ModelResult, team_id_map: pl.DataFrame) -> pl.DataFrame:
-        att_var = [f"att[{i}]" for i in range(1, team_id_map.shape[0] + 1)]
-        def_var = [f"def[{i}]" for i in range(1, team_id_map.shape[0] + 1)]
 
-        team_latent_params = (
-            pl.concat([
-                (
-                    pl.DataFrame(model.model.summary().loc[att_var, ["5%", "50%", "95%"]])
-                    .with_columns(pl.Series("att_var", att_var).alias("var"))
-                ),
-                (
-                    pl.DataFrame(model.model.summary().loc[def_var, ["5%", "50%", "95%"]])
-                    .with_columns(pl.Series("def_var", def_var).alias("var"))
-                )
-            ])
-            .with_columns(pl.col("var").str.extract(r"(\d+)").cast(pl.Int32).alias("team_id"))
-            .with_columns(pl.col("var").str.extract(r"(att|def)").alias("type"))
-            .drop("var")
-            .join(team_id_map, left_on="team_id", right_on="id")
+    @metrics.span("model.team_params")
+    def __get_params_from_posterior(self, post: posterior_store.Posterior) -> pl.DataFrame:
+        return (
+            posterior_summary.quantiles(post, ["att", "def"])
+            .rename({"variable": "type", "index": "team_id"})
+            .join(post.team_id_map, left_on="team_id", right_on="id")
         )
 
-        return team_latent_params
+
+    def get_stored_team_params(self) -> pl.DataFrame | None:
+        with self.db.reader() as con:
+            team_params = db.read_team_params(con)
+        return team_params if team_params.shape[0] > 0 else None
+
+
+    def get_posterior_team_params(self, max_date: str, season: str) -> pl.DataFrame:
+        # att/def quantiles after the games up to max_date, fitting the posterior if needed
+        return self.__get_params_from_posterior(self.get_posterior(max_date, season))
+
+
+    def get_posterior_diagnostics(self, max_date: str, season: str, mode: str = "sample") -> pl.DataFrame:
+        # Full per-param summary (mean, sd, mcse, ess, r_hat, quantiles) of the posterior, cached, see posterior_summary.diagnostics
+        return posterior_summary.diagnostics(self.get_posterior(max_date, season, mode=mode))
+
+
+    def get_team_params_history(self, season: str, team: str | None = None) -> pl.DataFrame:
+        with self.db.reader() as con:
+            return db.read_team_params_history(con, season, team)
 
 
     def get_team_params(self) -> pl.DataFrame:
-        con = sqlite3.connect(self.path_to_db)
-        cursor = con.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='team_params';")
-        table_exists = cursor.fetchone()
-
-        if table_exists:
-            query = "SELECT * FROM team_params"
-            return pl.read_database(query=query, connection=con)
+        team_params = self.get_stored_team_params()
+
+        if team_params is not None:
+            return team_params
         else:
             today_date = datetime.now().strftime("%Y-%m-%d")
-            model = self.__fit_model(today_date, helper.get_nhl_season(today_date), "TOR", "BOS")
-            latent_team_params = self.__get_params(model, model.model_data.team_id_map)
-            return latent_team_params
+            post = self.get_posterior(today_date, helper.get_nhl_season(today_date))
+            return self.__get_params_from_posterior(post)
     
 
-    def get_prediction(self, max_date: str, season: str, home_team: str, away_team: str) -> PredResult:
+    def get_stored_prediction(self, max_date: str, home_team: str, away_team: str) -> PredResult | None:
+        # Precomputed prediction from pred_goal_data, None if the nightly update didn't cover it
+        with self.db.reader() as con:
+            out = db.read_pred_goal_data(con, max_date, home_team, away_team)
+
+        if out.shape[0] > 0:
+            return PredResult(out.drop("prob_home_team_win"), out["prob_home_team_win"][0], pl.DataFrame())
+        return None
+
+
+    def get_prediction(self, max_date: str, season: str, home_team: str, away_team: str, mode: str = "sample") -> PredResult:
         
-        con = sqlite3.connect(self.path_to_db)
-        cursor = con.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pred_goal_data';")
-        table_exists = cursor.fetchone()
-
-        if table_exists:
-            query = f"""
-                SELECT date_of_game as date, CAST(game_id as text) game_id, away_team, 
-                    home, away, prob_home_team_win, len
-                FROM pred_goal_data
-                WHERE date == "{max_date}" AND home_team == "{home_team}" AND away_team == "{away_team}"
-                ORDER BY game_id
-            """
-            out = pl.read_database(query=query, connection=con)
-
-            if out.shape[0] > 0:
-                return PredResult(out.drop("prob_home_team_win"), out["prob_home_team_win"][0], pl.DataFrame())
-
-
-        model = self.__fit_model(max_date, season, home_team, away_team)
-
-        # extracting predicted home and away goals from the model
-        home_new_draw = model.model.stan_variable("pred_home_goals")
-        away_new_draw = model.model.stan_variable("pred_away_goals")
-        prob_home_team_ot_win = model.model.stan_variable("home_ot_win_prob")
-
-        pred_df = (
-            pl.DataFrame({
-                "home_new_draw": home_new_draw,
-                "away_new_draw": away_new_draw,
-                "prob_home_team_ot_win": prob_home_team_ot_win
-            }).explode("home_new_draw", "away_new_draw", "prob_home_team_ot_win")
-            .rename({"home_new_draw": "home", "away_new_draw": "away"})
-        )
+        # the stored predictions come from the nightly NUTS fit
+        if mode == "sample":
+            stored = self.get_stored_prediction(max_date, home_team, away_team)
+            metrics.inc("prediction_cache_hits_total" if stored is not None else "prediction_cache_misses_total")
+            if stored is not None:
+                return stored
 
-        combination_counts = (
-            pred_df.group_by(["home", "away"]).len().sort(["home", "away"])
-            .with_columns((pl.col("len") / pl.col("len").sum()) * 100)
-        )
+        post = self.get_posterior(max_date, season, mode=mode)
 
-        # Getting probability of home team win
-        prob_home_team_win = (
-            pred_df
-            .with_columns(
-                pl.when(pl.col("home") > pl.col("away")).then(1)
-                .when(pl.col("home") < pl.col("away")).then(0)
-                .when(pl.col("home") == pl.col("away"))
-                .then((pl.col("prob_home_team_ot_win") > 0.5).cast(pl.Int32)).alias("home_team_win")
-            )["home_team_win"].mean()
-        )
+        # exact scoreline probabilities from the posterior draws of the team params
+        with metrics.span("model.score_grid"):
+            home_rate, away_rate = post.log_rates(post.team_index(home_team), post.team_index(away_team))
+            grid = simulation.score_grid(home_rate, away_rate)
+            pred_table = grid_table(grid)
 
         # Get team latent params
-        latent_team_params = self.__get_params(model, model.model_data.team_id_map)
+        latent_team_params = self.__get_params_from_posterior(post)
 
         return PredResult(
-            combination_counts,
-            prob_home_team_win,
-            latent_team_params
+            pred_table,
+            grid.home_win,
+            latent_team_params,
+            grid.outcomes()
         )
 
 
-    def get_playoff_prediction(self, max_date: str, season: str, home_team: str, away_team: str) -> pl.DataFrame:
-        con = sqlite3.connect(self.path_to_db)
-        cursor = con.cursor()
-        cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='pred_goal_data';")
-        table_exists = cursor.fetchone()
-
-        if table_exists:
-            query = f"""
-                SELECT date_of_game as date, CAST(game_id as text) game_id, away_team, 
-                    home, away, prob_home_team_win, len
-                FROM pred_goal_data
-                WHERE date == "{max_date}" AND home_team == "{home_team}" AND away_team == "{away_team}"
-                ORDER BY game_id
-            """
-            out = pl.read_database(query=query, connection=con)
-
-            if out.shape[0] > 0:
-                return PredResult(out.drop("prob_home_team_win"), out["prob_home_team_win"][0], pl.DataFrame())
-
-        games = [
-            {"home_team": home_team, "away_team": away_team, "pred_df": None},
-            {"home_team": home_team, "away_team": away_team, "pred_df": None},
-            {"home_team": away_team, "away_team": home_team, "pred_df": None},
-            {"home_team": away_team, "away_team": home_team, "pred_df": None},
-            {"home_team": home_team, "away_team": away_team, "pred_df": None},
-            {"home_team": away_team, "away_team": home_team, "pred_df": None},
-            {"home_team": home_team, "away_team": away_team, "pred_df": None}
-        ]
-        for i in range(7):
-            model = self.__fit_model(max_date, season, games[i]["home_team"], games[i]["away_team"])
-
-            # extracting predicted home and away goals from the model
-            home_new_draw = model.model.stan_variable("pred_home_goals")
-            away_new_draw = model.model.stan_variable("pred_away_goals")
-            prob_home_team_ot_win = model.model.stan_variable("home_ot_win_prob")
-
-            pred_df = (
-                pl.DataFrame({
-                    "home_new_draw": home_new_draw,
-                    "away_new_draw": away_new_draw,
-                    "prob_home_team_ot_win": prob_home_team_ot_win
-                }).explode("home_new_draw", "away_new_draw", "prob_home_team_ot_win")
-                .rename({"home_new_draw": "home", "away_new_draw": "away"})
-                .with_columns(
-                    pl.when(pl.col("home") > pl.col("away")).then(pl.lit(games[i]["home_team"]))
-                    .when(pl.col("home") < pl.col("away")).then(pl.lit(games[i]["away_team"]))
-                    .when(pl.col("home") == pl.col("away"))
-                        .then(
-                            pl.when(pl.col("prob_home_team_ot_win") >= 0.5).then(pl.lit(games[i]["home_team"]))
-                            .otherwise(pl.lit(games[i]["away_team"]))
-                        )
-                    .alias(f"game_{i+1}_res")
+    def __slate_grids(self, date_of_game: str, season: str, games: pl.DataFrame, mode: str) -> list[simulation.ScoreGrid]:
+        # Score grids of games from the posterior of everything played before date_of_game
+        max_date = (datetime.strptime(date_of_game, "%Y-%m-%d") - timedelta(days=1)).strftime("%Y-%m-%d")
+        post = self.get_posterior(max_date, season, mode=mode)
+
+        with metrics.span("model.score_grid"):
+            home_idx = np.array([post.team_index(t) for t in games["home_team"].to_list()])
+            away_idx = np.array([post.team_index(t) for t in games["away_team"].to_list()])
+            home_rate, away_rate = post.log_rates(home_idx, away_idx)
+            return simulation.score_grids(home_rate, away_rate)
+
+
+    def get_slate_prediction(self, date_of_game: str, games: pl.DataFrame, mode: str = "sample") -> pl.DataFrame:
+        """
+        Predicts every game of a day at once (games has game_id, home_team, away_team) from the one
+        posterior of the games played before date_of_game. Returns rows shaped like pred_goal_data.
+        """
+        grids = self.__slate_grids(date_of_game, helper.get_nhl_season(date_of_game), games, mode)
+
+        with metrics.span("model.slate_table"):
+            return pl.concat([
+                grid_table(grid).with_columns(
+                    pl.lit(date_of_game).alias("date_of_game"),
+                    pl.lit(g["game_id"]).alias("game_id"),
+                    pl.lit(g["home_team"]).alias("home_team"),
+                    pl.lit(g["away_team"]).alias("away_team"),
+                    pl.lit(grid.home_win).alias("prob_home_team_win")
                 )
-            )
+                for g, grid in zip(games.iter_rows(named=True), grids)
+            ])
 
-            games[i]["pred_df"] = pred_df
-        
 
-        def playoff_res(row):
-            teams = list(set(row))
-            if len(teams) != 2:
-                return f"{teams[0]} Win in 4 games"
-            
-            t1, t2 = teams
-            res = {t1: 0, t2: 0}
-            for i, teams in enumerate(row):
-                if teams == t1:
-                    res[t1] += 1
-                else:
-                    res[t2] += 1
-                
-                if res[t1] == 4:
-                    return f"{t1} Win in {i+1} games"
-                elif res[t2] == 4:
-                    return f"{t2} Win in {i+1} games"
-        playoff_sim = (
-            pl.concat(map(lambda x: x[1]["pred_df"].select(f"game_{x[0]+1}_res"), enumerate(games)), how="horizontal")
-            .map_rows(playoff_res)
-            .group_by("map")
-            .count()
+    def get_playoff_prediction(self, max_date: str, season: str, home_team: str, away_team: str, mode: str = "sample") -> SeriesPredResult:
+        # home_team is the team with home ice, i.e. at home for games 1, 2, 5 and 7
+        post = self.get_posterior(max_date, season, mode=mode)
+        rng = simulation.posterior_rng(post, self.seed)
+
+        with metrics.span("model.simulate_series"):
+            sim = simulation.simulate_series(post, post.team_index(home_team), post.team_index(away_team), rng)
+
+        series_df = pl.DataFrame({
+            "winner": np.where(sim.top_seed_win, home_team, away_team),
+            "games": sim.games
+        })
+
+        outcomes = (
+            series_df
+            .group_by(["winner", "games"]).len("count")
             .sort("count")
             .with_columns(
-                ((pl.col("count").cast(pl.Float32) / pl.col("count").sum()) * 100).alias("prob")
+                ((pl.col("count").cast(pl.Float32) / pl.col("count").sum()) * 100).alias("prob"),
+                pl.format("{} Win in {} games", pl.col("winner"), pl.col("games")).alias("map")
             )
         )
 
-        return playoff_sim
+        series_length = (
+            series_df
+            .group_by("games").len("count")
+            .sort("games")
+            .with_columns(((pl.col("count").cast(pl.Float32) / pl.col("count").sum()) * 100).alias("prob"))
+        )
+
+        winner = (
+            series_df
+            .group_by("winner").len("count")
+            .sort("winner")
+            .with_columns(((pl.col("count").cast(pl.Float32) / pl.col("count").sum()) * 100).alias("prob"))
+        )
+
+        return SeriesPredResult(outcomes, series_length, winner)
     
 
-    def get_log_loss(self):
-        pass
+    def get_date_prediction(self, date_of_game: str, season: str, mode: str = "sample") -> pl.DataFrame:
+        """
+        Out of sample prediction of the games played on date_of_game, fit strictly on the days
+        before it, next to what happened. Empty if there were no games or nothing to fit on yet.
+        """
+        with self.db.reader() as con:
+            games = db.read_games_on(con, season, date_of_game)
+            has_history = db.read_goal_data(con, season, date_of_game).shape[0] > games.shape[0]
+        if games.shape[0] == 0 or not has_history:
+            return pl.DataFrame()
+
+        # a team's first game of the season still needs its (prior only) params in the fit
+        with self.db.writer() as con:
+            db.ensure_season_teams(con, season, games["home_team"].to_list() + games["away_team"].to_list())
+
+        grids = self.__slate_grids(date_of_game, season, games, mode)
+        return games.with_columns(
+            pl.lit(date_of_game).alias("date"),
+            pl.Series("prob_home_team_win", [g.home_win for g in grids]),
+            (pl.col("winning_team") == pl.col("home_team")).alias("home_team_win")
+        )
 
 
-    def get_accuracy(self):
-        pass
+    def get_walk_forward_predictions(self, season: str, start_date: str | None = None, end_date: str | None = None, mode: str = "sample") -> pl.DataFrame:
+        # get_date_prediction for every game date of season in [start_date, end_date], see backtest.py for the parallel version
+        with self.db.reader() as con:
+            dates = walk_forward_dates(con, season, start_date, end_date)
 
+        preds = [p for p in (self.get_date_prediction(d, season, mode) for d in dates) if p.shape[0] > 0]
+        return pl.concat(preds) if len(preds) > 0 else pl.DataFrame()
 
-    def get_season_prediction(self, overwrite = False) -> dict[str, int]:
-        
-        if not overwrite:
-            if os.path.exists("data/seasons_proj.json"):
-                with open("data/seasons_proj.json", "r") as f:
-                    return json.load(f)
 
+    def __walk_forward_summary(self, season: str, start_date: str | None, end_date: str | None, mode: str) -> dict:
+        preds = self.get_walk_forward_predictions(season, start_date, end_date, mode)
+        if preds.shape[0] == 0:
+            raise ValueError(f"No games to score in {season} between {start_date} and {end_date}")
+        return evaluation.summarize(preds)
 
-        today_date = datetime.now().strftime("%Y-%m-%d")
-        games_to_sim = helper.get_reg_scheduled_games(today_date, "2025-04-17")
-        current_standings = helper.get_current_standings()
-        current_points = dict(zip(current_standings["team"], current_standings["points"]))
 
+    def get_log_loss(self, season: str, start_date: str | None = None, end_date: str | None = None, mode: str = "sample") -> float:
+        return self.__walk_forward_summary(season, start_date, end_date, mode)["log_loss"]
 
-        res = self.__fit_model_multiple_preds(today_date, "2024", games_to_sim["home_team"].to_list(), games_to_sim["away_team"].to_list())
-        pred_home_goals = res.model.stan_variable("pred_home_goals")
-        pred_away_goals = res.model.stan_variable("pred_away_goals")
-        home_ot_win_prob = res.model.stan_variable("home_ot_win_prob")
 
+    def get_accuracy(self, season: str, start_date: str | None = None, end_date: str | None = None, mode: str = "sample") -> float:
+        return self.__walk_forward_summary(season, start_date, end_date, mode)["accuracy"]
 
-        # Defs
-        # W -> 2
-        # L -> 3
-        # OT -> 4
-        # OTW -> 5
-        # OTL -> 6
 
-        home_sim_res = np.where(pred_home_goals > pred_away_goals, 2, np.where(pred_home_goals < pred_away_goals, 3, 4))
-        home_sim_res[np.where(home_sim_res == 4)] = np.random.binomial(1, home_ot_win_prob[np.where(home_sim_res == 4)])
-        home_sim_res = np.where(home_sim_res == 1, 5, home_sim_res)
-        home_sim_res = np.where(home_sim_res == 0, 6, home_sim_res)
+    def get_stored_season_prediction(self) -> dict | None:
+        if os.path.exists("data/seasons_proj.json"):
+            with open("data/seasons_proj.json", "r") as f:
+                return json.load(f)
+        return None
 
-        away_sim_res = np.where(home_sim_res == 2, 3, np.where(home_sim_res == 3, 2, np.where(home_sim_res == 5, 6, 5)))
+
+    def get_season_prediction(self, overwrite = False, date_of_pred: str | None = None, mode: str = "sample") -> dict:
         
-        away_sim_res = np.where(away_sim_res == 2, 2, np.where(away_sim_res == 3, 0, np.where(away_sim_res == 5, 2, 1)))
-        home_sim_res = np.where(home_sim_res == 2, 2, np.where(home_sim_res == 3, 0, np.where(home_sim_res == 5, 2, 1)))
-
-        team_point_proj = {}
-        for team in set(games_to_sim["home_team"].unique().to_list() + games_to_sim["away_team"].unique().to_list()):
-            team_home_games_idx = (
-                (games_to_sim["home_team"] == team)
-            ).arg_true().to_list()
-
-            team_away_games_idx = (
-                (games_to_sim["away_team"] == team)
-            ).arg_true().to_list()
-
-            team_point_proj[team] = (home_sim_res[:,team_home_games_idx].sum(axis = 1) + away_sim_res[:,team_away_games_idx].sum(axis = 1)) + current_points[team]
-            team_point_proj[team] = team_point_proj[team].tolist()
-        return team_point_proj
+        if not overwrite and mode == "sample":
+            stored = self.get_stored_season_prediction()
+            if stored is not None:
+                return stored
+
+        if date_of_pred is None:
+            date_of_pred = datetime.now().strftime("%Y-%m-%d")
+
+        # the season and how far to simulate both follow from the date
+        season = helper.get_nhl_season(date_of_pred)
+        season_dates = helper.get_season_start_end_dates(season)
+        if len(season_dates) == 0:
+            raise ValueError(f"No regular season dates found for {season}")
+        start_date, end_date = (d.strftime("%Y-%m-%d") for d in season_dates)
+
+        if date_of_pred <= end_date:
+            games_to_sim = helper.get_reg_scheduled_games(max(date_of_pred, start_date), end_date)
+        else:
+            games_to_sim = pl.DataFrame({"home_team": [], "away_team": []})
+
+        standings = helper.get_current_standings().select(["team", "points", "conference", "division"])
+
+        post = self.get_posterior(date_of_pred, season, mode=mode)
+        with metrics.span("model.simulate_season"):
+            team_summary, rank_dist, playoff_line = simulation.project_season(
+                post, games_to_sim, standings, simulation.posterior_rng(post, self.seed)
+            )
+
+        return {
+            **simulation.SeasonProjection(
+                season, start_date, end_date, team_summary, rank_dist, playoff_line
+            ).to_dict(),
+            "inference_mode": mode
+        }
     
 
-    def get_prediction_heatmap_html(self, max_date: str, season: str, home_team: str, away_team: str) -> str:
-        pred = self.get_prediction(max_date, season, home_team, away_team)
+    def get_prediction_heatmap_html(self, max_date: str, season: str, home_team: str, away_team: str, mode: str = "sample") -> str:
+        pred = self.get_prediction(max_date, season, home_team, away_team, mode)
 
         fig = go.Figure(data=go.Heatmap(
             z=pred.pred_table["len"].to_list(),
@@ -422,12 +597,15 @@ class GamePredModel:
         season_proj = self.get_season_prediction()
         fig = go.Figure()
 
-        sorted_teams = sorted(season_proj.items(), key=lambda x: np.median(x[1]), reverse=True)
-        
-        for team, points in sorted_teams:
+        # teams are already sorted by median projected points
+        for team in season_proj["teams"]:
             fig.add_trace(go.Box(
-            y=points,
-            name=team,
+            name=team["team"],
+            q1=[team["25%"]],
+            median=[team["50%"]],
+            q3=[team["75%"]],
+            lowerfence=[team["5%"]],
+            upperfence=[team["95%"]],
             showlegend=False
             ))
 
@@ -437,4 +615,4 @@ class GamePredModel:
             xaxis_title="Teams"
         )
 
-        return fig.to_html(full_html=False)
\ No newline at end of file
+        return fig.to_html(full_html=False)
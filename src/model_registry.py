@@ -0,0 +1,107 @@
+import fcntl
+import glob
+import hashlib
+import os
+import shutil
+import sys
+import threading
+import time
+
+import cmdstanpy
+
+import metrics as metrics
+
+
+MAKE_LOCAL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "make", "local")
+EXE_EXTENSION = ".exe" if os.name == "nt" else ""
+
+_models: dict[str, cmdstanpy.CmdStanModel] = {}
+_lock = threading.Lock()
+
+
+def read_make_local(path: str = MAKE_LOCAL) -> dict:
+    # Uncommented KEY=VALUE lines of make/local, passed on to cmdstan's make as cpp_options
+    opts = {}
+    if not os.path.exists(path):
+        return opts
+
+    with open(path, "r") as f:
+        for line in f:
+            line = line.strip()
+            if line == "" or line.startswith("#") or "+=" in line or "=" not in line:
+                continue
+            k, v = line.split("=", 1)
+            opts[k.strip()] = True if v.strip() == "true" else v.strip()
+
+    return opts
+
+
+def model_hash(stan_file: str, cpp_options: dict) -> str:
+    h = hashlib.sha256()
+    with open(stan_file, "rb") as f:
+        h.update(f.read())
+    h.update(repr(sorted(cpp_options.items())).encode())
+    return h.hexdigest()
+
+
+def compile_model(stan_file: str, build_dir: str | None = None, cpp_options: dict | None = None) -> str:
+    """
+    Compiles stan_file into build_dir (default: <model dir>/build) keyed by the hash of the
+    source and cpp_options, and returns the executable path. Already built hashes are reused,
+    a file lock keeps concurrent processes from compiling the same model twice.
+    """
+    if cpp_options is None:
+        cpp_options = read_make_local()
+    if build_dir is None:
+        build_dir = os.path.join(os.path.dirname(os.path.abspath(stan_file)), "build")
+
+    name = os.path.splitext(os.path.basename(stan_file))[0]
+    key = model_hash(stan_file, cpp_options)
+    src = os.path.join(build_dir, f"{name}_{key[:12]}.stan")
+    exe = os.path.splitext(src)[0] + EXE_EXTENSION
+
+    if os.path.exists(exe):
+        return exe
+
+    os.makedirs(build_dir, exist_ok=True)
+    with open(f"{src}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            if not os.path.exists(exe):
+                shutil.copyfile(stan_file, src)
+                t0 = time.perf_counter()
+                cmdstanpy.CmdStanModel(stan_file=src, cpp_options=cpp_options, compile="force")
+                metrics.observe("stan_model_compile_seconds", time.perf_counter() - t0, model=name)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+    return exe
+
+
+def get_model(stan_file: str) -> cmdstanpy.CmdStanModel:
+    # Returns the process-wide CmdStanModel for stan_file, compiling only if no build exists
+    cpp_options = read_make_local()
+    key = model_hash(stan_file, cpp_options)
+
+    with _lock:
+        if key in _models:
+            return _models[key]
+
+        t0 = time.perf_counter()
+        exe = compile_model(stan_file, cpp_options=cpp_options)
+        model = cmdstanpy.CmdStanModel(exe_file=exe)
+        cold_start = time.perf_counter() - t0
+
+        name = os.path.splitext(os.path.basename(stan_file))[0]
+        metrics.set_gauge("stan_model_cold_start_seconds", cold_start, model=name)
+        _models[key] = model
+
+    return model
+
+
+if __name__ == "__main__":
+    # Build ahead of time, e.g. at image build: python src/model_registry.py [src/model/model.stan ...]
+    # with no arguments every model under src/model is built
+    model_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "model")
+    for f in sys.argv[1:] or sorted(glob.glob(os.path.join(model_dir, "*.stan"))):
+        print(compile_model(f))
@@ -0,0 +1,122 @@
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os
+import re
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import metrics as metrics
+import response_cache as response_cache
+
+
+# Both hosts can be pointed at a local stand-in, see nhl_stub_server.py
+API_WEB_BASE = os.environ.get("NHL_API_WEB_BASE", "https://api-web.nhle.com")
+API_STATS_BASE = os.environ.get("NHL_API_STATS_BASE", "https://api.nhle.com")
+# Responses are cached on disk, set NHL_CACHE_PATH="" to disable
+CACHE_PATH = os.environ.get("NHL_CACHE_PATH", "data/nhl_cache.db")
+
+
+def endpoint_name(path: str) -> str:
+    # /v1/score/2024-10-10 -> /v1/score/{date}, keeps metric labels low cardinality
+    return re.sub(r"\d{4}-\d{2}-\d{2}", "{date}", path)
+
+
+class NHLClient:
+    """
+    Pooled, retrying client for the NHL endpoints. get_many fans requests out over a
+    bounded thread pool that shares the session's connection pool. Responses go through
+    an optional on-disk TTL cache (see response_cache.ttl_for).
+    """
+
+    def __init__(self, web_base: str = API_WEB_BASE, stats_base: str = API_STATS_BASE,
+                 max_workers: int = 8, retries: int = 3, backoff: float = 0.5, timeout: float = 10,
+                 cache_path: str | None = CACHE_PATH):
+        self.cache = response_cache.ResponseCache(cache_path) if cache_path else None
+        self.web_base = web_base.rstrip("/")
+        self.stats_base = stats_base.rstrip("/")
+        self.max_workers = max_workers
+        self.timeout = timeout
+
+        retry = Retry(
+            total=retries,
+            backoff_factor=backoff,
+            status_forcelist=[429, 500, 502, 503, 504],
+            allowed_methods=["GET"]
+        )
+        adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max_workers, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+
+    def _fetch(self, url: str, endpoint: str) -> dict:
+        resp = self.session.get(url, timeout=self.timeout)
+        resp.raise_for_status()
+        metrics.inc("nhl_api_requests_total", endpoint=endpoint)
+        return resp.json()
+
+
+    def get_json(self, path: str, stats_api: bool = False) -> dict:
+        base = self.stats_base if stats_api else self.web_base
+        url = f"{base}{path}"
+        endpoint = endpoint_name(path)
+
+        if self.cache is None:
+            return self._fetch(url, endpoint)
+
+        return self.cache.get_or_fetch(
+            url, response_cache.ttl_for(path), lambda: self._fetch(url, endpoint), endpoint
+        )
+
+
+    def get_many(self, paths: list[str], stats_api: bool = False) -> list[dict]:
+        # results come back in the order of paths
+        if len(paths) <= 1:
+            return [self.get_json(p, stats_api) for p in paths]
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(paths))) as pool:
+            return list(pool.map(lambda p: self.get_json(p, stats_api), paths))
+
+
+    def get_schedule(self, first_date: str, last_date: str) -> list[dict]:
+        """
+        Every gameWeek day in [first_date, last_date] (YYYY-MM-DD). A schedule response covers
+        a week, so only one request per 7 days is made and overlapping days are dropped.
+        """
+        start = datetime.strptime(first_date, "%Y-%m-%d").date()
+        end = datetime.strptime(last_date, "%Y-%m-%d").date()
+
+        week_starts = []
+        d = start
+        while d <= end:
+            week_starts.append(d.strftime("%Y-%m-%d"))
+            d += timedelta(days=7)
+
+        days = {}
+        for week in self.get_many([f"/v1/schedule/{d}" for d in week_starts]):
+            for day in week.get("gameWeek", []):
+                if first_date <= day["date"] <= last_date:
+                    days[day["date"]] = day
+
+        return [days[d] for d in sorted(days.keys())]
+
+
+    def get_scores(self, dates: list[str]) -> dict[str, dict]:
+        return dict(zip(dates, self.get_many([f"/v1/score/{d}" for d in dates])))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> NHLClient:
+    # One client (and connection pool) per process, threadpool requests may ask at once
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = NHLClient()
+        return _client
@@ -0,0 +1,217 @@
+from argparse import ArgumentParser
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import sqlite3
+import threading
+import time
+
+import helper as helper
+
+
+# Division/conference of each franchise, the stub's standings need them
+DIVISIONS = {
+    "A": ["BOS", "BUF", "DET", "FLA", "MTL", "OTT", "TBL", "TOR"],
+    "M": ["CAR", "CBJ", "NJD", "NYI", "NYR", "PHI", "PIT", "WSH"],
+    "C": ["ARI", "UTA", "CHI", "COL", "DAL", "MIN", "NSH", "STL", "WPG"],
+    "P": ["ANA", "CGY", "EDM", "LAK", "SEA", "SJS", "VAN", "VGK"]
+}
+CONFERENCES = {"A": "E", "M": "E", "C": "W", "P": "W"}
+
+
+class FixtureData:
+    """
+    Serves the NHL endpoints the app uses from rows shaped like goal_data
+    (date, id, away_team, home_team, home_goals, away_goals, winning_team).
+    Rows with home_goals None are scheduled games that haven't been played yet.
+    """
+
+    def __init__(self, rows: list[dict]):
+        self.by_date = {}
+        for r in rows:
+            self.by_date.setdefault(r["date"], []).append(r)
+        self.dates = sorted(self.by_date.keys())
+
+    @classmethod
+    def from_db(cls, path_to_db: str) -> "FixtureData":
+        con = sqlite3.connect(path_to_db)
+        con.row_factory = sqlite3.Row
+        rows = [dict(r) for r in con.execute(
+            "SELECT date, id, away_team, home_team, home_goals, away_goals, winning_team FROM goal_data"
+        )]
+        con.close()
+        return cls(rows)
+
+    def _game(self, r: dict) -> dict:
+        season = int(str(r["id"])[0:4])
+        return {
+            "id": r["id"],
+            "season": int(f"{season}{season + 1}"),
+            "gameType": int(str(r["id"])[4:6]),
+            "homeTeam": {"abbrev": r["home_team"]},
+            "awayTeam": {"abbrev": r["away_team"]}
+        }
+
+    def _goals(self, r: dict) -> list[dict]:
+        # only the running score matters to the app: regulation final, plus the OT/SO winner on ties
+        goals = [{"period": 3, "homeScore": r["home_goals"], "awayScore": r["away_goals"]}]
+        if r["home_goals"] == r["away_goals"]:
+            home_win = r["winning_team"] == r["home_team"]
+            goals.append({
+                "period": 4,
+                "homeScore": r["home_goals"] + int(home_win),
+                "awayScore": r["away_goals"] + int(not home_win)
+            })
+        return goals
+
+    def schedule(self, date: str) -> dict:
+        start = datetime.strptime(date, "%Y-%m-%d").date()
+        week = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(7)]
+        return {
+            "gameWeek": [
+                {"date": d, "games": [self._game(r) for r in self.by_date.get(d, [])]}
+                for d in week
+            ]
+        }
+
+    def score(self, date: str) -> dict:
+        return {
+            "games": [
+                {**self._game(r), "goals": self._goals(r)}
+                for r in self.by_date.get(date, [])
+                if r["home_goals"] is not None
+            ]
+        }
+
+    def standings(self) -> dict:
+        # "now" standings, i.e. the latest season in the fixtures
+        season = helper.get_nhl_season(self.dates[-1])
+        table = {}
+        for d in self.dates:
+            if helper.get_nhl_season(d) != season:
+                continue
+            for r in self.by_date[d]:
+                for team in (r["home_team"], r["away_team"]):
+                    table.setdefault(team, {"wins": 0, "losses": 0, "otLosses": 0})
+                if r["home_goals"] is None:
+                    continue
+                loser = r["away_team"] if r["winning_team"] == r["home_team"] else r["home_team"]
+                table[r["winning_team"]]["wins"] += 1
+                table[loser]["otLosses" if r["home_goals"] == r["away_goals"] else "losses"] += 1
+
+        division = {t: div for div, teams in DIVISIONS.items() for t in teams}
+        out = []
+        for team, rec in table.items():
+            div = division.get(team, "A")
+            out.append({
+                "teamAbbrev": {"default": team},
+                "conferenceAbbrev": CONFERENCES[div],
+                "divisionAbbrev": div,
+                "points": 2 * rec["wins"] + rec["otLosses"],
+                **rec
+            })
+        return {"standings": sorted(out, key=lambda x: -x["points"])}
+
+    def seasons(self) -> dict:
+        seasons = {}
+        for d in self.dates:
+            seasons.setdefault(helper.get_nhl_season(d), []).append(d)
+        return {
+            "data": [
+                {
+                    "id": int(f"{s}{int(s) + 1}"),
+                    "regularSeasonStartDate": f"{ds[0]}T00:00:00",
+                    "regularSeasonEndDate": f"{ds[-1]}T00:00:00"
+                }
+                for s, ds in seasons.items()
+            ]
+        }
+
+
+def make_handler(fixtures: FixtureData, latency: float):
+    routes = [
+        (re.compile(r"^/v1/schedule/(\d{4}-\d{2}-\d{2})$"), fixtures.schedule),
+        (re.compile(r"^/v1/score/(\d{4}-\d{2}-\d{2})$"), fixtures.score),
+        (re.compile(r"^/v1/standings/now$"), fixtures.standings),
+        (re.compile(r"^/stats/rest/en/season$"), fixtures.seasons)
+    ]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            # simulated upstream round trip
+            time.sleep(latency)
+            for pattern, route in routes:
+                m = pattern.match(self.path)
+                if m:
+                    body = json.dumps(route(*m.groups())).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+            self.send_error(404)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(fixtures: FixtureData, port: int = 0, latency: float = 0.0) -> ThreadingHTTPServer:
+    # Starts the stub on a daemon thread, port 0 picks a free port (see server.server_address)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(fixtures, latency))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench(fixtures: FixtureData, latency: float) -> None:
+    import nhl_client as nhl_client
+
+    server = serve(fixtures, latency=latency)
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    # no response cache, both passes have to go over the wire (and data/nhl_cache.db stays untouched)
+    client = nhl_client.NHLClient(web_base=base, stats_base=base, cache_path=None)
+    first, last = fixtures.dates[0], fixtures.dates[-1]
+
+    t0 = time.perf_counter()
+    n_days = 0
+    d = datetime.strptime(first, "%Y-%m-%d").date()
+    while d <= datetime.strptime(last, "%Y-%m-%d").date():
+        client.get_json(f"/v1/schedule/{d}")
+        n_days += 1
+        d += timedelta(days=1)
+    sequential = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    days = client.get_schedule(first, last)
+    pooled = time.perf_counter() - t0
+
+    print(json.dumps({
+        "days": len(days),
+        "sequential_requests": n_days,
+        "sequential_seconds": round(sequential, 3),
+        "pooled_requests": -(-n_days // 7),
+        "pooled_seconds": round(pooled, 3)
+    }))
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("-p", "--pathtodb", default="data/data.db")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bench", action="store_true")
+
+    args = parser.parse_args()
+    fixtures = FixtureData.from_db(args.pathtodb)
+
+    if args.bench:
+        bench(fixtures, args.latency)
+    else:
+        # point the app at it with NHL_API_WEB_BASE / NHL_API_STATS_BASE=http://127.0.0.1:<port>
+        server = serve(fixtures, args.port, args.latency)
+        print(f"Serving NHL stub on http://127.0.0.1:{server.server_address[1]}")
+        threading.Event().wait()
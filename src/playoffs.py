@@ -1,37 +1,101 @@
 import model
 import helper
+import posterior_store
+import simulation
 
 import json
 from datetime import date
+import numpy as np
 import polars as pl
-import re
+
+
+CONFERENCES = ["eastern_conference", "western_conference"]
 
 
 class PlayoffSim:
     def __init__(self, path_to_bracket: str):
         with open(path_to_bracket, 'r') as file:
             self.nhl_playoff_bracket = json.load(file)
-    
-    def model_bracket(self):
+
+
+    def __play_series(self, post, team_a, team_b, seed_points, rng) -> np.ndarray:
+        # Home ice goes to the team with more regular season points, decided per draw
+        a_top = seed_points[team_a] >= seed_points[team_b]
+        top = np.where(a_top, team_a, team_b)
+        bottom = np.where(a_top, team_b, team_a)
+
+        sim = simulation.simulate_series(post, top, bottom, rng)
+        return np.where(sim.top_seed_win, top, bottom)
+
+
+    def simulate_bracket(self, post: posterior_store.Posterior, seed_points: dict[str, int], seed: int | None = None) -> pl.DataFrame:
+        """
+        Simulates the whole bracket, round_1 through the finals, once per posterior draw with
+        the winners carried forward. Returns, per team, the probability of winning each round.
+        """
+        rng = simulation.posterior_rng(post, seed)
+        n_draws = post.draws["mu"].shape[0]
+        teams = post.team_id_map.sort("id")["team"].to_list()
+        points = np.array([seed_points.get(t, 0) for t in teams])
+
+        rounds = [r for r in self.nhl_playoff_bracket.keys() if r != "finals"]
+        round_winners = {r: [] for r in rounds + ["finals"]}
+
+        conference_winners = []
+        for conference in CONFERENCES:
+            matchups = self.nhl_playoff_bracket[rounds[0]][conference]["matchups"]
+            alive = []
+            for k in sorted(matchups.keys()):
+                alive.append(np.full(n_draws, post.team_index(matchups[k]["home"])))
+                alive.append(np.full(n_draws, post.team_index(matchups[k]["away"])))
+
+            # adjacent series winners meet in the next round
+            for r in rounds:
+                alive = [
+                    self.__play_series(post, alive[i], alive[i + 1], points, rng)
+                    for i in range(0, len(alive), 2)
+                ]
+                round_winners[r] += alive
+
+            conference_winners += alive
+
+        round_winners["finals"].append(
+            self.__play_series(post, conference_winners[0], conference_winners[1], points, rng)
+        )
+
+        advancement = {"team": teams}
+        for r, winners in round_winners.items():
+            counts = np.bincount(np.concatenate(winners), minlength=len(teams))
+            advancement[r] = counts / n_draws
+
+        return (
+            pl.DataFrame(advancement)
+            .filter(pl.col(rounds[0]) > 0)
+            .sort("finals", descending=True)
+        )
+
+
+    def model_bracket(self, mode: str = "sample") -> pl.DataFrame:
         Mod = model.GamePredModel(
             "data/data.db",
             "src/model/model.stan"
         )
 
+        date_of_pred = date.today().strftime("%Y-%m-%d")  # Get today's date in YYYY-MM-DD format
+        season = helper.get_nhl_season(date_of_pred)
+        post = Mod.get_posterior(date_of_pred, season, mode=mode)
+
+        for conference in CONFERENCES:
+            for k, v in self.nhl_playoff_bracket["round_1"][conference]["matchups"].items():
+                out = Mod.get_playoff_prediction(date_of_pred, season, v["home"], v["away"], mode)
+                most_likely = out.outcomes.filter(pl.col("prob") == pl.col("prob").max())
+                v["winner"] = most_likely["winner"][0]
+                v["games"] = str(most_likely["games"][0])
+
+        standings = helper.get_current_standings()
+        advancement = self.simulate_bracket(post, dict(zip(standings["team"], standings["points"])), Mod.seed)
 
-        for round in ["round_1"]:
-            if round != "finals":
-                for conference in ["eastern_conference", "western_conference"]:
-                    for k, v in self.nhl_playoff_bracket[round][conference]["matchups"].items():
-                        home_team = v["home"]
-                        away_team = v["away"]
-                        date_of_pred = date.today().strftime("%Y-%m-%d")  # Get today's date in YYYY-MM-DD format
-                        season = helper.get_nhl_season(date_of_pred)
-                        out = Mod.get_playoff_prediction(date_of_pred, season, home_team, away_team)
-                        winning_team = out.filter(pl.col("prob") == pl.col("prob").max())["map"][0]
-                        v["winner"] = winning_team[0:3]
-                        v["games"] = re.findall("\\d", winning_team)[0]
-        
-        
         print(self.nhl_playoff_bracket)
+        print(advancement)
 
+        return advancement
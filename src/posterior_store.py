@@ -0,0 +1,200 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from dataclasses import dataclass
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+import numpy as np
+import polars as pl
+
+import metrics as metrics
+
+
+# Parameters the predictions are built from, every matchup can be answered from these
+PARAM_VARS = ["mu", "is_home", "att", "def"]
+
+# Per posterior directory index of what's stored, see PosteriorStore
+MANIFEST = "manifest.json"
+
+
+@dataclass
+class Posterior:
+    season: str
+    max_date: str
+    fingerprint: str
+    # variable -> (draws, ...) array, memory-mapped (MappedDraws) once stored
+    draws: Mapping[str, np.ndarray]
+    team_id_map: pl.DataFrame
+    # inference algorithm the draws came from, see model.INFERENCE_MODES
+    mode: str = "sample"
+    # draws are stacked chain after chain, 1 for the approximate modes
+    chains: int = 1
+
+    def team_index(self, team: str) -> int:
+        # 0-based column into att/def for a team abbreviation
+        ids = self.team_id_map.filter(pl.col("team") == team)["id"].to_list()
+        if len(ids) == 0:
+            raise KeyError(f"Unknown team {team}")
+        return ids[0] - 1
+
+    def log_rates(self, home_idx, away_idx) -> tuple[np.ndarray, np.ndarray]:
+        # (draws, ...) log scoring rates for home/away team indices, mirrors model.stan
+        mu = self.draws["mu"].reshape(-1, *([1] * np.ndim(home_idx)))
+        is_home = self.draws["is_home"].reshape(-1, *([1] * np.ndim(home_idx)))
+        att = self.draws["att"]
+        dfn = self.draws["def"]
+        home_rate = mu + is_home + att[:, home_idx] + dfn[:, away_idx]
+        away_rate = mu + att[:, away_idx] + dfn[:, home_idx]
+        return home_rate, away_rate
+
+
+def fingerprint(model_df: pl.DataFrame, team_id_map: pl.DataFrame) -> str:
+    # Hash of exactly the rows/columns the likelihood sees and of the team ids, teams registered
+    # after a fit (without games yet) still need their prior only params in the posterior
+    h = hashlib.sha256()
+    h.update(model_df.select(["game_id", "home_id", "away_id", "home_goals", "away_goals"]).write_csv().encode())
+    h.update(team_id_map.select(["team", "id"]).sort("id").write_csv().encode())
+    return h.hexdigest()
+
+
+class MappedDraws(Mapping):
+    """
+    Draws of a stored posterior, each variable memory-mapped read-only from its .npy on first
+    access. Pickles as the directory, so pool workers hand back posteriors without copying draws.
+    """
+
+    def __init__(self, path: str, variables: list[str]):
+        self.path = path
+        self.variables = variables
+        self._arrays: dict[str, np.ndarray] = {}
+
+    def __getitem__(self, v: str) -> np.ndarray:
+        if v not in self.variables:
+            raise KeyError(v)
+        if v not in self._arrays:
+            self._arrays[v] = np.load(os.path.join(self.path, f"{v}.npy"), mmap_mode="r")
+        return self._arrays[v]
+
+    def __iter__(self):
+        return iter(self.variables)
+
+    def __len__(self) -> int:
+        return len(self.variables)
+
+    def __getstate__(self) -> dict:
+        return {"path": self.path, "variables": self.variables}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state["path"], state["variables"])
+
+
+class PosteriorStore:
+    """
+    Posterior draws keyed by (season, max_date, inference mode, fingerprint of the training rows).
+    Each posterior is a directory under cache_dir with one .npy per variable and a manifest.json
+    (key, teams, variable shapes). Reads memory-map only the variables used, so every process
+    shares the same pages. Recently used posteriors are kept in a bounded in-memory LRU.
+    """
+
+    def __init__(self, cache_dir: str, max_in_memory: int = 8):
+        self.cache_dir = cache_dir
+        self.max_in_memory = max_in_memory
+        self._lru: OrderedDict[tuple, Posterior] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key: tuple) -> str:
+        season, max_date, mode, fp = key
+        return os.path.join(self.cache_dir, f"{season}_{max_date}_{mode}_{fp[:16]}")
+
+    def _remember(self, key: tuple, post: Posterior) -> None:
+        with self._lock:
+            self._lru[key] = post
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_in_memory:
+                self._lru.popitem(last=False)
+
+    def _open(self, path: str) -> Posterior:
+        with open(os.path.join(path, MANIFEST), "r") as f:
+            manifest = json.load(f)
+
+        team_id_map = pl.DataFrame({
+            "team": manifest["teams"],
+            "id": manifest["team_ids"]
+        }).with_columns(pl.col("id").cast(pl.Int32))
+
+        return Posterior(
+            manifest["season"],
+            manifest["max_date"],
+            manifest["fingerprint"],
+            MappedDraws(path, list(manifest["variables"])),
+            team_id_map,
+            manifest["mode"],
+            # manifests written before chains were recorded
+            manifest.get("chains", 1)
+        )
+
+    def get(self, season: str, max_date: str, fp: str, mode: str = "sample") -> Posterior | None:
+        key = (season, max_date, mode, fp)
+        with self._lock:
+            if key in self._lru:
+                self._lru.move_to_end(key)
+                metrics.inc("posterior_cache_hits_total")
+                return self._lru[key]
+
+        # a miss is counted by whoever goes on to fit (model.get_posterior), not by every probe
+        path = self._path(key)
+        if not os.path.exists(os.path.join(path, MANIFEST)):
+            return None
+
+        post = self._open(path)
+        self._remember(key, post)
+        metrics.inc("posterior_cache_hits_total")
+        metrics.inc("posterior_cache_disk_loads_total")
+        return post
+
+    def put(self, post: Posterior, persist: bool = True) -> Posterior:
+        """
+        Stores post and returns the stored, memory-mapped, version of it. With persist=False it's
+        only remembered, e.g. a posterior a fit worker process already wrote.
+        """
+        key = (post.season, post.max_date, post.mode, post.fingerprint)
+        if not persist:
+            self._remember(key, post)
+            return post
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # write a temp dir first and rename it, so readers never see a partial posterior
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_path, exist_ok=True)
+        variables = {}
+        for v, draws in post.draws.items():
+            draws = np.ascontiguousarray(draws)
+            np.save(os.path.join(tmp_path, f"{v}.npy"), draws)
+            variables[v] = {"shape": list(draws.shape), "dtype": draws.dtype.str}
+
+        with open(os.path.join(tmp_path, MANIFEST), "w") as f:
+            json.dump({
+                "season": post.season,
+                "max_date": post.max_date,
+                "mode": post.mode,
+                "chains": post.chains,
+                "fingerprint": post.fingerprint,
+                "teams": post.team_id_map["team"].to_list(),
+                "team_ids": post.team_id_map["id"].to_list(),
+                "variables": variables
+            }, f)
+
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # another process stored the same posterior first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+        stored = self._open(path)
+        self._remember(key, stored)
+        return stored
@@ -0,0 +1,76 @@
+from collections import OrderedDict
+import threading
+
+import numpy as np
+import polars as pl
+
+import adaptation as adaptation
+import metrics as metrics
+import posterior_store as posterior_store
+
+
+QUANTILES = [0.05, 0.5, 0.95]
+
+# Posteriors whose full diagnostics were asked for, see diagnostics()
+MAX_CACHED_DIAGNOSTICS = 8
+_diagnostics_cache: OrderedDict[tuple, pl.DataFrame] = OrderedDict()
+_lock = threading.Lock()
+
+
+def flat_draws(post: posterior_store.Posterior, variables: list[str]) -> tuple[np.ndarray, list[str], list[int]]:
+    # (draws, elements) matrix of every element of variables, with each column's variable and 1-based index
+    cols, names, index = [], [], []
+    for v in variables:
+        x = post.draws[v].reshape(post.draws[v].shape[0], -1)
+        cols.append(x)
+        names += [v] * x.shape[1]
+        index += list(range(1, x.shape[1] + 1))
+    return np.concatenate(cols, axis=1), names, index
+
+
+def quantiles(post: posterior_store.Posterior, variables: list[str], probs: list[float] = QUANTILES) -> pl.DataFrame:
+    """
+    Quantiles of each element of variables (one row per element: variable, index, "5%", ...),
+    in one np.quantile pass over only those variables' draws.
+    """
+    x, names, index = flat_draws(post, variables)
+    q = np.quantile(x, probs, axis=0)
+    return pl.DataFrame({
+        "variable": names,
+        "index": pl.Series(index, dtype=pl.Int32),
+        **{f"{int(p * 100)}%": q[i] for i, p in enumerate(probs)}
+    })
+
+
+def diagnostics(post: posterior_store.Posterior) -> pl.DataFrame:
+    """
+    Mean, sd, MCSE, ESS and split R-hat next to the quantiles, for every stored variable. Only
+    computed on request and cached per posterior. R-hat needs the post's chains, a single chain
+    (the approximate modes) is split in halves.
+    """
+    key = (post.season, post.max_date, post.mode, post.fingerprint)
+    with _lock:
+        if key in _diagnostics_cache:
+            _diagnostics_cache.move_to_end(key)
+            return _diagnostics_cache[key]
+
+    with metrics.span("posterior_summary.diagnostics"):
+        variables = list(post.draws)
+        x, names, index = flat_draws(post, variables)
+        by_chain = x.reshape(post.chains, -1, x.shape[1]).transpose(1, 0, 2)
+
+        sd = x.std(axis=0, ddof=1)
+        ess = adaptation.ess(by_chain)
+        out = quantiles(post, variables).with_columns(
+            pl.Series("mean", x.mean(axis=0)),
+            pl.Series("sd", sd),
+            pl.Series("mcse", sd / np.sqrt(ess)),
+            pl.Series("ess", ess),
+            pl.Series("r_hat", adaptation.split_rhat(by_chain))
+        )
+
+    with _lock:
+        _diagnostics_cache[key] = out
+        while len(_diagnostics_cache) > MAX_CACHED_DIAGNOSTICS:
+            _diagnostics_cache.popitem(last=False)
+    return out
@@ -0,0 +1,136 @@
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import db as db
+import metrics as metrics
+
+
+MINUTE = 60
+DAY = 24 * 60 * MINUTE
+FOREVER = None
+
+DATE_RE = re.compile(r"(\d{4}-\d{2}-\d{2})")
+
+
+def ttl_for(path: str) -> float | None:
+    """
+    Seconds a response for path stays fresh, None when it can never change.
+    Past days are immutable, anything relative to "now" expires within minutes.
+    """
+    today = date.today()
+    m = DATE_RE.search(path)
+    d = datetime.strptime(m.group(1), "%Y-%m-%d").date() if m else None
+
+    if path.startswith(("/v1/schedule/", "/v1/score/")) and d is None:
+        # /v1/schedule/now, /v1/score/now, same as the standings
+        return 5 * MINUTE
+    if path.startswith("/v1/schedule/"):
+        # a schedule response covers the week starting at d
+        return FOREVER if d + timedelta(days=7) < today else 15 * MINUTE
+    if path.startswith("/v1/score/"):
+        # yesterday's late games can still be final-izing
+        return FOREVER if d < today - timedelta(days=1) else 2 * MINUTE
+    if path.startswith("/v1/standings/now"):
+        return 5 * MINUTE
+    if path.startswith("/stats/rest/en/season"):
+        return DAY
+
+    return 5 * MINUTE
+
+
+class ResponseCache:
+    """
+    Persistent JSON response cache (sqlite) with per-key TTLs. Concurrent misses on the
+    same key are coalesced into one upstream fetch.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.dirname(path) != "":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # shared by the api and updater processes, so WAL and a busy timeout like db.ConnectionManager
+        self._con = sqlite3.connect(path, timeout=db.BUSY_TIMEOUT_MS / 1000, check_same_thread=False)
+        self._con.execute(f"PRAGMA busy_timeout = {db.BUSY_TIMEOUT_MS}")
+        self._con.execute("PRAGMA journal_mode = WAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, body TEXT, fetched_at REAL)"
+        )
+        self._con.commit()
+
+        self._lock = threading.Lock()
+        self._inflight: dict[str, Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+
+    def _read(self, key: str, ttl: float | None) -> dict | None:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT body, fetched_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        if ttl is not None and time.time() - row[1] > ttl:
+            return None
+        return json.loads(row[0])
+
+
+    def _write(self, key: str, body: dict) -> None:
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO responses (key, body, fetched_at) VALUES (?, ?, ?)",
+                (key, json.dumps(body), time.time())
+            )
+            self._con.commit()
+
+
+    def get_or_fetch(self, key: str, ttl: float | None, fetch, endpoint: str = "") -> dict:
+        cached = self._read(key, ttl)
+        if cached is not None:
+            self.hits += 1
+            metrics.inc("nhl_cache_hits_total", endpoint=endpoint)
+            return cached
+
+        with self._lock:
+            fut = self._inflight.get(key)
+            leader = fut is None
+            if leader:
+                fut = Future()
+                self._inflight[key] = fut
+
+        if not leader:
+            self.coalesced += 1
+            metrics.inc("nhl_cache_coalesced_total", endpoint=endpoint)
+            return fut.result()
+
+        self.misses += 1
+        metrics.inc("nhl_cache_misses_total", endpoint=endpoint)
+        try:
+            body = fetch()
+            self._write(key, body)
+            fut.set_result(body)
+            return body
+        except Exception as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "hit_rate": self.hits / total if total > 0 else 0.0
+        }
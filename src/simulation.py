@@ -0,0 +1,296 @@
+from dataclasses import dataclass
+import hashlib
+
+import numpy as np
+import polars as pl
+from scipy import sparse
+from scipy import stats
+
+import posterior_store as posterior_store
+
+
+# Home ice in a best-of-seven (2-2-1-1-1), True when the higher seed is at home
+HOME_ICE_PATTERN = np.array([True, True, False, False, True, False, True])
+
+# Regulation goals per team covered by a score grid, P(more) is ~1e-6 at the league's scoring rates
+MAX_GOALS = 15
+
+# Regular season ties: 5 minutes of sudden death OT at the regulation rates, then a coin flip shootout
+OT_FRACTION = 5 / 60
+
+
+@dataclass
+class SeriesSim:
+    top_seed_win: np.ndarray   # (draws,) bool
+    games: np.ndarray          # (draws,) series length in [4, 7]
+
+
+def posterior_rng(post: posterior_store.Posterior, seed: int | None = None) -> np.random.Generator:
+    # Unless a seed is given, seeded from the posterior's key so a cached posterior always simulates the same
+    if seed is None:
+        key = f"{post.season}_{post.max_date}_{post.mode}_{post.fingerprint}"
+        seed = int(hashlib.sha256(key.encode()).hexdigest()[:16], 16)
+    return np.random.default_rng(seed)
+
+
+def per_draw_log_rates(post: posterior_store.Posterior, home_idx: np.ndarray, away_idx: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    # Same as Posterior.log_rates, but the matchup can differ per draw: indices are (draws, k)
+    att = post.draws["att"]
+    dfn = post.draws["def"]
+    mu = post.draws["mu"][:, None]
+    is_home = post.draws["is_home"][:, None]
+
+    home_rate = (
+        mu + is_home
+        + np.take_along_axis(att, home_idx, axis=1)
+        + np.take_along_axis(dfn, away_idx, axis=1)
+    )
+    away_rate = (
+        mu
+        + np.take_along_axis(att, away_idx, axis=1)
+        + np.take_along_axis(dfn, home_idx, axis=1)
+    )
+    return home_rate, away_rate
+
+
+def simulate_playoff_games(home_rate: np.ndarray, away_rate: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    # Playoff home win indicator per game, ties go to an untimed sudden death OT won with prob home_rate / (home_rate + away_rate)
+    home_lambda = np.exp(home_rate)
+    away_lambda = np.exp(away_rate)
+
+    home_goals = rng.poisson(home_lambda)
+    away_goals = rng.poisson(away_lambda)
+    home_ot_win = rng.random(home_lambda.shape) < home_lambda / (home_lambda + away_lambda)
+
+    return np.where(home_goals == away_goals, home_ot_win, home_goals > away_goals)
+
+
+def tie_break(home_lambda: np.ndarray, away_lambda: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # A regular season tie's P(home OT win), P(away OT win) and P(shootout win) of either side
+    total_lambda = home_lambda + away_lambda
+    ot_decided = 1 - np.exp(-total_lambda * OT_FRACTION)
+    home_share = home_lambda / total_lambda
+    return ot_decided * home_share, ot_decided * (1 - home_share), (1 - ot_decided) / 2
+
+
+def simulate_regular_season_games(home_rate: np.ndarray, away_rate: np.ndarray, rng: np.random.Generator) -> tuple[np.ndarray, np.ndarray]:
+    # Home win and tie (decided in OT/shootout, the loser gets a point) indicators per game
+    home_lambda = np.exp(home_rate)
+    away_lambda = np.exp(away_rate)
+
+    home_goals = rng.poisson(home_lambda)
+    away_goals = rng.poisson(away_lambda)
+    home_ot, _, shootout = tie_break(home_lambda, away_lambda)
+    home_tie_win = rng.random(home_lambda.shape) < home_ot + shootout
+
+    tie = home_goals == away_goals
+    return np.where(tie, home_tie_win, home_goals > away_goals), tie
+
+
+@dataclass
+class ScoreGrid:
+    probs: np.ndarray   # (MAX_GOALS + 1, MAX_GOALS + 1) regulation scoreline probs, [home goals, away goals]
+    home_regulation: float
+    away_regulation: float
+    home_ot: float
+    away_ot: float
+    home_shootout: float
+    away_shootout: float
+
+    @property
+    def home_win(self) -> float:
+        return self.home_regulation + self.home_ot + self.home_shootout
+
+    def outcomes(self) -> dict[str, float]:
+        return {
+            "home_regulation": self.home_regulation,
+            "away_regulation": self.away_regulation,
+            "home_ot": self.home_ot,
+            "away_ot": self.away_ot,
+            "home_shootout": self.home_shootout,
+            "away_shootout": self.away_shootout
+        }
+
+
+def score_grids(home_rate: np.ndarray, away_rate: np.ndarray, max_goals: int = MAX_GOALS) -> list[ScoreGrid]:
+    """
+    Exact posterior predictive of regular season games from (draws, games) log rates: per game, the
+    mean over draws of the outer product of the home and away Poisson pmfs, plus the OT/shootout split of ties.
+    """
+    home_lambda = np.exp(home_rate)
+    away_lambda = np.exp(away_rate)
+    goals = np.arange(max_goals + 1)
+
+    home_pmf = stats.poisson.pmf(goals, home_lambda[..., None])   # (draws, games, goals)
+    away_pmf = stats.poisson.pmf(goals, away_lambda[..., None])
+    probs = np.einsum("dkg,dkh->kgh", home_pmf, away_pmf) / home_rate.shape[0]
+
+    # a tie's OT depends on the draw's rates, so it's split per draw before averaging
+    tie = np.sum(home_pmf * away_pmf, axis=2)
+    home_ot, away_ot, shootout = (np.mean(tie * p, axis=0) for p in tie_break(home_lambda, away_lambda))
+
+    return [
+        ScoreGrid(
+            probs[k],
+            float(np.tril(probs[k], -1).sum()),
+            float(np.triu(probs[k], 1).sum()),
+            float(home_ot[k]),
+            float(away_ot[k]),
+            float(shootout[k]),
+            float(shootout[k])
+        )
+        for k in range(probs.shape[0])
+    ]
+
+
+def score_grid(home_rate: np.ndarray, away_rate: np.ndarray, max_goals: int = MAX_GOALS) -> ScoreGrid:
+    # score_grids for a single game, rates are (draws,)
+    return score_grids(home_rate[:, None], away_rate[:, None], max_goals)[0]
+
+
+def simulate_series(post: posterior_store.Posterior, top_idx, bottom_idx, rng: np.random.Generator) -> SeriesSim:
+    """
+    Plays out a best-of-seven for every posterior draw. top_idx/bottom_idx are 0-based team
+    indices, either scalars or (draws,) arrays when the matchup differs per draw.
+    """
+    n_draws = post.draws["mu"].shape[0]
+    top_idx = np.broadcast_to(np.asarray(top_idx), (n_draws,))[:, None]
+    bottom_idx = np.broadcast_to(np.asarray(bottom_idx), (n_draws,))[:, None]
+
+    home_idx = np.where(HOME_ICE_PATTERN, top_idx, bottom_idx)
+    away_idx = np.where(HOME_ICE_PATTERN, bottom_idx, top_idx)
+
+    home_rate, away_rate = per_draw_log_rates(post, home_idx, away_idx)
+    top_wins = simulate_playoff_games(home_rate, away_rate, rng) == HOME_ICE_PATTERN
+
+    # All seven games are simulated, the series ends at the first team to 4 wins
+    wins = np.cumsum(top_wins, axis=1)
+    losses = np.cumsum(~top_wins, axis=1)
+    games = np.argmax((wins == 4) | (losses == 4), axis=1) + 1
+
+    return SeriesSim(wins[np.arange(n_draws), games - 1] == 4, games)
+
+
+@dataclass
+class SeasonProjection:
+    season: str
+    start_date: str
+    end_date: str
+    teams: pl.DataFrame          # team, conference, division, current/projected point percentiles, playoff_prob
+    rank_dist: pl.DataFrame      # team x league rank probabilities
+    playoff_line: pl.DataFrame   # conference, percentiles of the last wild card team's points
+
+    def to_dict(self) -> dict:
+        return {
+            "season": self.season,
+            "start_date": self.start_date,
+            "end_date": self.end_date,
+            "teams": self.teams.to_dicts(),
+            "rank_dist": self.rank_dist.to_dicts(),
+            "playoff_line": self.playoff_line.to_dicts()
+        }
+
+
+def incidence_matrix(home_idx: np.ndarray, away_idx: np.ndarray, n_teams: int) -> sparse.csr_matrix:
+    # (2 * games, teams): row g credits the home team of game g, row games + g the away team
+    n_games = len(home_idx)
+    rows = np.arange(2 * n_games)
+    cols = np.concatenate([home_idx, away_idx])
+    return sparse.csr_matrix((np.ones(2 * n_games), (rows, cols)), shape=(2 * n_games, n_teams))
+
+
+def simulate_season_points(post: posterior_store.Posterior, home_idx: np.ndarray, away_idx: np.ndarray, rng: np.random.Generator) -> np.ndarray:
+    """
+    Points gained over the remaining schedule, (draws, teams). A win is worth 2, an OT/SO loss 1.
+    """
+    home_rate, away_rate = post.log_rates(home_idx, away_idx)
+    home_win, tie = simulate_regular_season_games(home_rate, away_rate, rng)
+    home_pts = np.where(home_win, 2, tie.astype(int))
+    away_pts = np.where(home_win, tie.astype(int), 2)
+
+    # one product for every team and draw: [home_pts | away_pts] @ incidence
+    inc = incidence_matrix(home_idx, away_idx, post.draws["att"].shape[1])
+    return np.asarray((inc.T @ np.hstack([home_pts, away_pts]).T).T)
+
+
+def playoff_qualifiers(score: np.ndarray, conference: np.ndarray, division: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Top 3 of each division plus the 2 best remaining teams (wild cards) of each conference.
+    Teams without a division/conference ("", e.g. not in the standings) never qualify.
+    Returns (qualified, wild card) as (draws, teams) bool.
+    """
+    rows = np.arange(score.shape[0])[:, None]
+    qualified = np.zeros(score.shape, dtype=bool)
+    wild_card = np.zeros(score.shape, dtype=bool)
+
+    for div in np.unique(division[division != ""]):
+        idx = np.flatnonzero(division == div)
+        top = np.argsort(-score[:, idx], axis=1)[:, :3]
+        qualified[rows, idx[top]] = True
+
+    for conf in np.unique(conference[conference != ""]):
+        idx = np.flatnonzero((conference == conf) & (division != ""))
+        remaining = np.where(qualified[:, idx], -np.inf, score[:, idx])
+        top = np.argsort(-remaining, axis=1)[:, :2]
+        # a conference with fewer than 2 teams left over has fewer wild cards
+        wild_card[rows, idx[top]] = np.take_along_axis(remaining, top, axis=1) > -np.inf
+
+    return qualified | wild_card, wild_card
+
+
+def project_season(post: posterior_store.Posterior, schedule: pl.DataFrame, standings: pl.DataFrame, rng: np.random.Generator) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """
+    schedule: remaining games with home_team/away_team. standings: team, points, conference, division.
+    Returns (team summary, rank distribution, playoff line) without keeping the per draw arrays around.
+    """
+    teams = post.team_id_map.sort("id")["team"].to_list()
+    n_teams = len(teams)
+
+    standings = pl.DataFrame({"team": teams}).join(standings, on="team", how="left")
+    current_points = standings["points"].fill_null(0).to_numpy()
+    conference = standings["conference"].fill_null("").to_numpy()
+    division = standings["division"].fill_null("").to_numpy()
+
+    home_idx = np.array([post.team_index(t) for t in schedule["home_team"].to_list()], dtype=int)
+    away_idx = np.array([post.team_index(t) for t in schedule["away_team"].to_list()], dtype=int)
+
+    points = current_points + simulate_season_points(post, home_idx, away_idx, rng)
+
+    # random fractional part breaks ties in the rankings
+    score = points + rng.random(points.shape) * 0.5
+    qualified, wild_card = playoff_qualifiers(score, conference, division)
+
+    ranks = np.argsort(np.argsort(-score, axis=1), axis=1)
+    rank_counts = np.bincount(
+        (np.arange(n_teams) * n_teams + ranks).ravel(), minlength=n_teams * n_teams
+    ).reshape(n_teams, n_teams)
+
+    quantiles = [0.05, 0.25, 0.5, 0.75, 0.95]
+    q = np.quantile(points, quantiles, axis=0)
+
+    team_summary = (
+        pl.DataFrame({
+            "team": teams,
+            "conference": conference,
+            "division": division,
+            "current_points": current_points,
+            "mean": points.mean(axis=0),
+            **{f"{int(p * 100)}%": q[i] for i, p in enumerate(quantiles)},
+            "playoff_prob": qualified.mean(axis=0)
+        })
+        .sort("50%", descending=True)
+    )
+
+    rank_dist = pl.DataFrame(
+        rank_counts / points.shape[0],
+        schema=[f"rank_{i + 1}" for i in range(n_teams)],
+        orient="row"
+    ).insert_column(0, pl.Series("team", teams))
+
+    # points of each conference's last wild card team, i.e. the playoff line
+    line = []
+    for conf in np.unique(conference[conference != ""]):
+        conf_points = np.where(wild_card & (conference == conf), points, np.inf).min(axis=1)
+        line.append({"conference": conf, **{f"{int(p * 100)}%": v for p, v in zip(quantiles, np.quantile(conf_points, quantiles))}})
+
+    return team_summary, rank_dist, pl.DataFrame(line)
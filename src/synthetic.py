@@ -0,0 +1,83 @@
+from datetime import date, timedelta
+
+import numpy as np
+import polars as pl
+
+import db as db
+import helper as helper
+import nhl_stub_server as nhl_stub_server
+
+
+# Real abbreviations first so the stub's standings know their divisions
+TEAM_CODES = [t for teams in nhl_stub_server.DIVISIONS.values() for t in teams]
+
+# Log scale league parameters, roughly what the fitted model gives for the NHL
+MU = np.log(3.0)
+IS_HOME = 0.05
+TEAM_SD = 0.15
+
+
+def team_codes(n_teams: int) -> list[str]:
+    return (TEAM_CODES + [f"T{i:02d}" for i in range(len(TEAM_CODES), n_teams)])[:n_teams]
+
+
+def generate_season(season: int, teams: list[str], games_per_team: int, today: date, rng: np.random.Generator) -> list[dict]:
+    """
+    One regular season as goal_data rows, starting October 8th. Each round pairs every team up
+    once (with an odd number of teams the bye rotates), spread over two days. Games before today
+    are played, later ones are only scheduled (goals and winner None).
+    """
+    n = len(teams)
+    att = rng.normal(0, TEAM_SD, n)
+    dfn = rng.normal(0, TEAM_SD, n)
+
+    start = date(season, 10, 8)
+    rows = []
+    for r in range(games_per_team):
+        playing = np.arange(n) if n % 2 == 0 else np.delete(np.arange(n), r % n)
+        pairs = rng.permutation(playing).reshape(-1, 2)
+        for k, (h, a) in enumerate(pairs):
+            d = start + timedelta(days=2 * r + int(k >= len(pairs) // 2))
+            row = {
+                "date": d.strftime("%Y-%m-%d"),
+                "id": int(f"{season}02{len(rows) + 1:04d}"),
+                "home_team": teams[h],
+                "away_team": teams[a],
+                "home_goals": None,
+                "away_goals": None,
+                "winning_team": None
+            }
+            if d < today:
+                home_lambda = np.exp(MU + IS_HOME + att[h] + dfn[a])
+                away_lambda = np.exp(MU + att[a] + dfn[h])
+                home_goals, away_goals = int(rng.poisson(home_lambda)), int(rng.poisson(away_lambda))
+                home_win = home_goals > away_goals if home_goals != away_goals else rng.random() < home_lambda / (home_lambda + away_lambda)
+                row.update({
+                    "home_goals": home_goals,
+                    "away_goals": away_goals,
+                    "winning_team": teams[h] if home_win else teams[a]
+                })
+            rows.append(row)
+    return rows
+
+
+def generate_league(n_teams: int = 32, n_seasons: int = 1, games_per_team: int = 82, today: date | None = None, seed: int = 0) -> list[dict]:
+    # n_seasons seasons ending with the one today falls in (played up to yesterday), as goal_data rows
+    today = today or date.today()
+    current = int(helper.get_nhl_season(today.strftime("%Y-%m-%d")))
+    teams = team_codes(n_teams)
+    rng = np.random.default_rng(seed)
+
+    rows = []
+    for season in range(current - n_seasons + 1, current + 1):
+        rows += generate_season(season, teams, games_per_team, today, rng)
+    return rows
+
+
+def write_goal_data(path_to_db: str, rows: list[dict]) -> None:
+    # Played rows into goal_data (replacing what's there) with their teams registered
+    played = pl.DataFrame([r for r in rows if r["home_goals"] is not None])
+    with db.get_manager(path_to_db).writer() as con:
+        db.clear_goal_data(con)
+        db.insert_goal_data(con, played)
+        db.sync_teams_from_goal_data(con)
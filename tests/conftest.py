@@ -0,0 +1,6 @@
+import os
+import sys
+
+
+# The app modules are flat files in src/ imported by name, as when run from src/ or with it on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src"))
@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+import adaptation as adaptation
+
+
+def ar1(rng: np.random.Generator, phi: float, shape: tuple) -> np.ndarray:
+    # (iterations, chains, params) AR(1) chains with unit stationary variance
+    x = np.empty(shape)
+    x[0] = rng.normal(size=shape[1:])
+    for t in range(1, shape[0]):
+        x[t] = phi * x[t - 1] + np.sqrt(1 - phi ** 2) * rng.normal(size=shape[1:])
+    return x
+
+
+def test_ess_of_independent_draws():
+    draws = np.random.default_rng(0).normal(size=(1000, 4, 3))
+    ess = adaptation.ess(draws)
+
+    assert ess.shape == (3,)
+    assert np.all(np.abs(ess / 4000 - 1) < 0.15)
+
+
+def test_ess_of_autocorrelated_draws():
+    # ESS of an AR(1) is n * (1 - phi) / (1 + phi)
+    phi = 0.8
+    draws = ar1(np.random.default_rng(1), phi, (2000, 4, 3))
+    ess = adaptation.ess(draws)
+
+    assert np.all(np.abs(ess / (8000 * (1 - phi) / (1 + phi)) - 1) < 0.25)
+
+
+def test_split_rhat_of_mixed_chains():
+    draws = np.random.default_rng(2).normal(size=(1000, 4, 3))
+    assert adaptation.split_rhat(draws) == pytest.approx(np.ones(3), abs=0.01)
+
+
+def test_split_rhat_flags_unmixed_chains():
+    draws = np.random.default_rng(3).normal(size=(1000, 4, 2))
+    # one chain stuck somewhere else, and a trend within every chain
+    draws[:, 0, 0] += 3
+    draws[:, :, 1] += np.linspace(0, 3, 1000)[:, None]
+
+    assert np.all(adaptation.split_rhat(draws) > 1.1)
+
+
+def test_degraded_compares_to_the_previous_fit():
+    prev = adaptation.Adaptation("2024", "2024-10-25", 2, [0.5], [[1.0, 1.0]], {}, 1.02, 1)
+
+    assert not adaptation.degraded((1.02, 1), prev)
+    assert adaptation.degraded((1.03, 0), prev)
+    assert adaptation.degraded((1.0, 2), prev)
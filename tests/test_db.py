@@ -0,0 +1,60 @@
+import threading
+
+import pytest
+
+import db as db
+
+
+@pytest.fixture
+def manager(tmp_path):
+    # ConnectionManager creates the schema (init_schema) on a fresh file
+    manager = db.ConnectionManager(str(tmp_path / "data.db"))
+    yield manager
+    manager.close()
+
+
+def test_planned_queries_use_their_index(manager):
+    with manager.reader() as con:
+        plans = db.check_query_plans(con)
+
+    assert set(plans) == {query for query, _, _ in db.PLANNED_QUERIES}
+    for query, _, index in db.PLANNED_QUERIES:
+        assert index in plans[query]
+
+
+def test_check_query_plans_raises_on_a_full_scan(manager, monkeypatch):
+    monkeypatch.setattr(db, "PLANNED_QUERIES", [
+        ("SELECT id FROM goal_data WHERE home_goals = ?", (3,), "goal_data_season_date")
+    ])
+    with manager.reader() as con, pytest.raises(db.QueryPlanError):
+        db.check_query_plans(con)
+
+
+def test_concurrent_team_registration_hands_out_unique_ids(tmp_path):
+    # one manager per "process", all registering new teams of the same season at once
+    path_to_db = str(tmp_path / "data.db")
+    managers = [db.ConnectionManager(path_to_db) for _ in range(6)]
+    barrier = threading.Barrier(len(managers))
+    errors = []
+
+    def register(i, manager):
+        barrier.wait()
+        try:
+            with manager.writer() as con:
+                db.ensure_season_teams(con, "2024", [f"T{i}{k}" for k in range(3)])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=register, args=(i, m)) for i, m in enumerate(managers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    with managers[0].reader() as con:
+        teams = db.get_season_teams(con, "2024")
+    for m in managers:
+        m.close()
+
+    assert errors == []
+    assert sorted(teams["id"].to_list()) == list(range(1, 19))
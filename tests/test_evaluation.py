@@ -0,0 +1,38 @@
+import math
+
+import numpy as np
+import polars as pl
+import pytest
+
+import evaluation as evaluation
+
+
+PROB = np.array([0.8, 0.4, 0.6, 0.1])
+OUTCOME = np.array([1.0, 0.0, 0.0, 0.0])
+
+
+def test_scores():
+    assert evaluation.log_loss(PROB, OUTCOME) == pytest.approx(-(math.log(0.8) + math.log(0.6) + math.log(0.4) + math.log(0.9)) / 4)
+    assert evaluation.brier(PROB, OUTCOME) == pytest.approx((0.04 + 0.16 + 0.36 + 0.01) / 4)
+    assert evaluation.accuracy(PROB, OUTCOME) == 0.75
+    # certain and right stays finite
+    assert np.isfinite(evaluation.log_loss(np.array([1.0, 0.0]), np.array([1.0, 0.0])))
+
+
+def test_calibration():
+    cal = evaluation.calibration(np.append(PROB, 1.0), np.append(OUTCOME, 1.0), bins=2)
+
+    # 0.1/0.4 in [0, 0.5), 0.6/0.8 and the clamped 1.0 in [0.5, 1]
+    assert cal["bin_start"].to_list() == [0.0, 0.5]
+    assert cal["predicted"].to_list() == pytest.approx([0.25, 0.8])
+    assert cal["observed"].to_list() == pytest.approx([0.0, 2 / 3])
+    assert cal["games"].to_list() == [2, 3]
+
+
+def test_summarize():
+    out = evaluation.summarize(pl.DataFrame({"prob_home_team_win": PROB, "home_team_win": OUTCOME.astype(bool)}))
+
+    assert out["games"] == 4
+    assert out["brier"] == pytest.approx(0.1425)
+    # one game per calibration bin: mean of |0.8 - 1|, |0.4 - 0|, |0.6 - 0|, |0.1 - 0|
+    assert out["calibration_error"] == pytest.approx(0.325)
@@ -0,0 +1,133 @@
+from datetime import date
+
+import numpy as np
+import polars as pl
+import pytest
+from scipy import stats
+
+import metrics as metrics
+import model as model
+import synthetic as synthetic
+
+
+SEASON = "2024"
+MAX_DATE = "2024-10-25"
+
+
+@pytest.fixture
+def mod(tmp_path):
+    # a small synthetic season, fully played by MAX_DATE
+    rows = synthetic.generate_league(n_teams=6, games_per_team=12, today=date(2024, 11, 1), seed=1)
+    path_to_db = str(tmp_path / "data.db")
+    synthetic.write_goal_data(path_to_db, rows)
+    return model.GamePredModel(path_to_db, "src/model/model.stan", str(tmp_path / "posteriors"))
+
+
+@pytest.fixture
+def dat(mod):
+    return mod._GamePredModel__get_model_data(MAX_DATE, SEASON)
+
+
+def test_cells_sum_to_the_games(dat):
+    per_game = (
+        dat.model_df
+        .group_by(["home_id", "away_id"])
+        .agg(pl.len().alias("n_games"), pl.col("home_goals").sum(), pl.col("away_goals").sum())
+        .sort(["home_id", "away_id"])
+    )
+
+    assert dat.cell_df.select(per_game.columns).cast(pl.Int64).equals(per_game.cast(pl.Int64))
+    assert dat.cell_df["n_games"].sum() == dat.model_df.shape[0]
+    assert dat.cell_df["home_goals"].sum() == dat.model_df["home_goals"].sum()
+    assert dat.cell_df["away_goals"].sum() == dat.model_df["away_goals"].sum()
+    assert dat.cell_df.select(["home_id", "away_id"]).is_unique().all()
+
+
+def test_collapsed_training_data_matches_cells(dat):
+    data = model.collapsed_training_data(dat)
+
+    assert data["n_teams"] == dat.team_id_map.shape[0]
+    assert data["K"] == dat.cell_df.shape[0] == len(data["home_teams"]) == len(data["n_games"])
+    assert sum(data["n_games"]) == dat.model_df.shape[0]
+    assert sum(data["home_goals"]) == dat.model_df["home_goals"].sum()
+    assert np.all(np.array(data["home_teams"]) != np.array(data["away_teams"]))
+
+
+def poisson_log_lik(home, away, goals_home, goals_away, mu, is_home, att, dfn, log_n_games=0):
+    # Sum of the home/away poisson_log terms of the likelihood, team ids are 1-based like in Stan
+    home_rate = log_n_games + mu + is_home + att[home - 1] + dfn[away - 1]
+    away_rate = log_n_games + mu + att[away - 1] + dfn[home - 1]
+    return stats.poisson.logpmf(goals_home, np.exp(home_rate)).sum() + stats.poisson.logpmf(goals_away, np.exp(away_rate)).sum()
+
+
+def test_collapsed_likelihood_matches_per_game(dat):
+    # the per-cell likelihood differs from the per-game one by a constant, so the posterior is the same
+    games = {c: dat.model_df[c].to_numpy() for c in ["home_id", "away_id", "home_goals", "away_goals"]}
+    cells = model.collapsed_training_data(dat)
+    cells = {c: np.array(cells[c]) for c in ["home_teams", "away_teams", "home_goals", "away_goals", "n_games"]}
+
+    rng = np.random.default_rng(5)
+    n_teams = dat.team_id_map.shape[0]
+    diffs = []
+    for _ in range(20):
+        params = (rng.normal(0.5, 0.5), rng.normal(0, 0.3), rng.normal(0, 0.5, n_teams), rng.normal(0, 0.5, n_teams))
+        per_game = poisson_log_lik(games["home_id"], games["away_id"], games["home_goals"], games["away_goals"], *params)
+        per_cell = poisson_log_lik(
+            cells["home_teams"], cells["away_teams"], cells["home_goals"], cells["away_goals"], *params,
+            log_n_games=np.log(cells["n_games"])
+        )
+        diffs.append(per_game - per_cell)
+
+    assert np.ptp(diffs) < 1e-8 * np.abs(diffs).max()
+
+
+@pytest.mark.parametrize("collapsed", [False, True])
+def test_reduce_sum_training_data_rows(dat, collapsed):
+    data = model.reduce_sum_training_data(dat, collapsed, grainsize=4)
+    rows = dat.cell_df if collapsed else dat.model_df
+
+    assert data["N"] == rows.shape[0]
+    assert sum(data["n_games"]) == dat.model_df.shape[0]
+    assert sum(data["away_goals"]) == dat.model_df["away_goals"].sum()
+    assert data["grainsize"] == 4
+
+
+def test_walk_forward_scores_need_games(mod):
+    with pytest.raises(ValueError):
+        mod.get_log_loss(SEASON, "2025-01-01", "2025-02-01")
+    with pytest.raises(ValueError):
+        mod.get_accuracy(SEASON, "2025-01-01", "2025-02-01")
+
+
+def test_posterior_key_uses_the_last_trained_date(mod):
+    # every game is played by 2024-10-31, later dates train on the same rows
+    dat = mod._GamePredModel__get_model_data("2024-12-01", SEASON)
+    last_date = dat.model_df["date"].max()
+    assert last_date < "2024-12-01"
+
+    n_teams = dat.team_id_map.shape[0]
+    draws = {"mu": np.zeros(4), "is_home": np.zeros(4), "att": np.zeros((4, n_teams)), "def": np.zeros((4, n_teams))}
+    fp = model.posterior_store.fingerprint(dat.model_df, dat.team_id_map)
+    mod.posterior_store.put(model.posterior_store.Posterior(SEASON, last_date, fp, draws, dat.team_id_map))
+
+    for max_date in ["2024-12-01", "2025-01-15"]:
+        post = mod.get_posterior(max_date, SEASON, fit=False)
+        assert post is not None and post.max_date == last_date
+
+
+def test_posterior_cache_miss_is_counted_once_by_the_fitter(mod, monkeypatch):
+    def misses():
+        return metrics.snapshot()["counters"].get(("posterior_cache_misses_total", ()), 0)
+
+    def no_cmdstan(path):
+        raise RuntimeError("no cmdstan")
+
+    before = misses()
+    # a probe (FitService's parent process) doesn't count, the process going on to fit does
+    assert mod.get_posterior(MAX_DATE, SEASON, fit=False) is None
+    assert misses() == before
+
+    monkeypatch.setattr(model.model_registry, "get_model", no_cmdstan)
+    with pytest.raises(RuntimeError):
+        mod.get_posterior(MAX_DATE, SEASON)
+    assert misses() == before + 1
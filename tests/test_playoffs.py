@@ -0,0 +1,60 @@
+import os
+
+import numpy as np
+import polars as pl
+import pytest
+
+import playoffs as playoffs
+import posterior_store as posterior_store
+
+
+PATH_TO_BRACKET = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "playoff_bracket.json")
+N_DRAWS = 400
+
+
+@pytest.fixture
+def sim():
+    return playoffs.PlayoffSim(PATH_TO_BRACKET)
+
+
+@pytest.fixture
+def post(sim):
+    # the bracket's 16 teams plus two that missed the playoffs, seeded draws
+    teams = [
+        m[side]
+        for conference in playoffs.CONFERENCES
+        for m in sim.nhl_playoff_bracket["round_1"][conference]["matchups"].values()
+        for side in ["home", "away"]
+    ] + ["XXX", "YYY"]
+    rng = np.random.default_rng(0)
+    return posterior_store.Posterior(
+        "2024", "2025-04-17", "test",
+        {
+            "mu": rng.normal(1.0, 0.05, N_DRAWS),
+            "is_home": rng.normal(0.1, 0.02, N_DRAWS),
+            "att": rng.normal(0.0, 0.2, (N_DRAWS, len(teams))),
+            "def": rng.normal(0.0, 0.2, (N_DRAWS, len(teams)))
+        },
+        pl.DataFrame({"team": teams, "id": range(1, len(teams) + 1)}),
+        chains=4
+    )
+
+
+def test_bracket_round_wins(sim, post):
+    points = {t: 100 - i for i, t in enumerate(post.team_id_map["team"].to_list())}
+    advancement = sim.simulate_bracket(post, points, seed=1)
+
+    assert advancement.shape[0] == 16
+    assert "XXX" not in advancement["team"].to_list()
+    # 8 series winners in round 1, then 4, 2 conference champions and the cup winner
+    assert [advancement[r].sum() for r in ["round_1", "round_2", "round_3", "finals"]] == pytest.approx([8, 4, 2, 1])
+    # a team only wins a round after winning the previous one
+    assert (advancement["round_1"] >= advancement["round_2"]).all()
+    assert (advancement["round_2"] >= advancement["round_3"]).all()
+    assert (advancement["round_3"] >= advancement["finals"]).all()
+
+
+def test_bracket_is_reproducible(sim, post):
+    points = {t: 90 for t in post.team_id_map["team"].to_list()}
+    assert sim.simulate_bracket(post, points).equals(sim.simulate_bracket(post, points))
+    assert sim.simulate_bracket(post, points, seed=1).equals(sim.simulate_bracket(post, points, seed=1))
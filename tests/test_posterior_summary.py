@@ -0,0 +1,46 @@
+import numpy as np
+import polars as pl
+import pytest
+
+import posterior_store as posterior_store
+import posterior_summary as posterior_summary
+
+
+@pytest.fixture
+def post():
+    rng = np.random.default_rng(0)
+    return posterior_store.Posterior(
+        "2024", "2024-10-25", "test",
+        {
+            "mu": rng.normal(1.0, 0.05, 1000),
+            "is_home": rng.normal(0.1, 0.02, 1000),
+            "att": rng.normal(0.0, 0.2, (1000, 3)),
+            "def": rng.normal(0.0, 0.2, (1000, 3))
+        },
+        pl.DataFrame({"team": ["AAA", "BBB", "CCC"], "id": [1, 2, 3]}),
+        chains=4
+    )
+
+
+def test_quantiles_match_numpy(post):
+    out = posterior_summary.quantiles(post, ["mu", "att", "def"])
+
+    assert out.columns == ["variable", "index", "5%", "50%", "95%"]
+    assert out["variable"].to_list() == ["mu"] + ["att"] * 3 + ["def"] * 3
+    assert out["index"].to_list() == [1, 1, 2, 3, 1, 2, 3]
+
+    for row in out.to_dicts():
+        draws = post.draws[row["variable"]]
+        x = draws if draws.ndim == 1 else draws[:, row["index"] - 1]
+        assert [row["5%"], row["50%"], row["95%"]] == pytest.approx(np.quantile(x, [0.05, 0.5, 0.95]))
+
+
+def test_diagnostics(post):
+    out = posterior_summary.diagnostics(post)
+
+    assert out.shape[0] == 8
+    assert out["mean"].to_numpy() == pytest.approx(posterior_summary.flat_draws(post, list(post.draws))[0].mean(axis=0))
+    # independent draws: ESS close to the draw count, R-hat close to 1
+    assert (out["ess"] > 700).all()
+    assert (out["r_hat"] - 1).abs().max() < 0.02
+    assert posterior_summary.diagnostics(post) is out
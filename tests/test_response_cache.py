@@ -0,0 +1,25 @@
+from datetime import date, timedelta
+
+import response_cache as response_cache
+
+
+def test_ttl_for():
+    past = (date.today() - timedelta(days=30)).strftime("%Y-%m-%d")
+    today = date.today().strftime("%Y-%m-%d")
+
+    assert response_cache.ttl_for(f"/v1/schedule/{past}") is response_cache.FOREVER
+    assert response_cache.ttl_for(f"/v1/score/{past}") is response_cache.FOREVER
+    assert response_cache.ttl_for(f"/v1/score/{today}") == 2 * response_cache.MINUTE
+    for path in ["/v1/schedule/now", "/v1/score/now", "/v1/standings/now"]:
+        assert response_cache.ttl_for(path) == 5 * response_cache.MINUTE
+
+
+def test_cache_is_shared_in_wal_mode(tmp_path):
+    path = str(tmp_path / "nhl_cache.db")
+    cache = response_cache.ResponseCache(path)
+    assert cache._con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    assert cache.get_or_fetch("/v1/standings/now", 60, lambda: {"a": 1}) == {"a": 1}
+    # another process' cache on the same file sees the response
+    other = response_cache.ResponseCache(path)
+    assert other.get_or_fetch("/v1/standings/now", 60, lambda: {"a": 2}) == {"a": 1}
@@ -0,0 +1,165 @@
+import numpy as np
+import polars as pl
+import pytest
+
+import posterior_store as posterior_store
+import simulation as simulation
+
+
+N_DRAWS = 400
+TEAMS = ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF", "GGG", "HHH", "III"]
+
+
+@pytest.fixture
+def post():
+    # seeded draws shaped like the model's, no cmdstan needed
+    rng = np.random.default_rng(0)
+    n_teams = len(TEAMS)
+    return posterior_store.Posterior(
+        "2024", "2024-10-25", "test",
+        {
+            "mu": rng.normal(1.0, 0.05, N_DRAWS),
+            "is_home": rng.normal(0.1, 0.02, N_DRAWS),
+            "att": rng.normal(np.linspace(-0.3, 0.3, n_teams), 0.05, (N_DRAWS, n_teams)),
+            "def": rng.normal(0.0, 0.1, (N_DRAWS, n_teams))
+        },
+        pl.DataFrame({"team": TEAMS, "id": range(1, n_teams + 1)}),
+        chains=4
+    )
+
+
+def test_score_grids_sum_to_one(post):
+    home_rate, away_rate = post.log_rates(np.array([0, 3, 7]), np.array([1, 2, 0]))
+    grids = simulation.score_grids(home_rate, away_rate)
+
+    assert len(grids) == 3
+    for grid in grids:
+        outcomes = grid.outcomes()
+        tie = np.trace(grid.probs)
+        # only the Poisson tails past MAX_GOALS are missing
+        assert grid.probs.sum() == pytest.approx(1, abs=1e-4)
+        assert sum(outcomes.values()) == pytest.approx(grid.probs.sum())
+        assert outcomes["home_ot"] + outcomes["away_ot"] + outcomes["home_shootout"] + outcomes["away_shootout"] == pytest.approx(tie)
+        assert grid.home_win == pytest.approx(outcomes["home_regulation"] + outcomes["home_ot"] + outcomes["home_shootout"])
+
+
+def test_score_grid_matches_score_grids(post):
+    home_rate, away_rate = post.log_rates(np.array([2, 5]), np.array([6, 1]))
+    grids = simulation.score_grids(home_rate, away_rate)
+
+    for k in range(2):
+        grid = simulation.score_grid(home_rate[:, k], away_rate[:, k])
+        assert np.allclose(grid.probs, grids[k].probs)
+        assert grid.outcomes() == pytest.approx(grids[k].outcomes())
+
+
+def test_simulated_games_match_the_score_grid(post):
+    # the season projection's game draws and the analytic grid share the OT/shootout rule
+    home_rate, away_rate = post.log_rates(np.array([7]), np.array([0]))
+    grid = simulation.score_grid(home_rate[:, 0], away_rate[:, 0])
+    outcomes = grid.outcomes()
+
+    reps = 500
+    home_win, tie = simulation.simulate_regular_season_games(
+        np.repeat(home_rate, reps, axis=1), np.repeat(away_rate, reps, axis=1), np.random.default_rng(4)
+    )
+    tie_prob = np.trace(grid.probs)
+    home_tie_win = (outcomes["home_ot"] + outcomes["home_shootout"]) / tie_prob
+
+    assert home_win.mean() == pytest.approx(grid.home_win, abs=0.005)
+    assert tie.mean() == pytest.approx(tie_prob, abs=0.005)
+    assert home_win[tie].mean() == pytest.approx(home_tie_win, abs=0.01)
+
+
+def test_simulate_series(post):
+    sim = simulation.simulate_series(post, post.team_index("HHH"), post.team_index("AAA"), np.random.default_rng(1))
+
+    assert sim.games.shape == sim.top_seed_win.shape == (N_DRAWS,)
+    assert np.all((sim.games >= 4) & (sim.games <= 7))
+    # the strongest attack beats the weakest more often than not
+    assert sim.top_seed_win.mean() > 0.5
+
+    again = simulation.simulate_series(post, post.team_index("HHH"), post.team_index("AAA"), np.random.default_rng(1))
+    assert np.array_equal(sim.games, again.games)
+    assert np.array_equal(sim.top_seed_win, again.top_seed_win)
+
+
+def test_simulate_series_winner_has_four_wins(post):
+    # replays the same seeded games to check the winner and length bookkeeping
+    top_idx = np.full(N_DRAWS, post.team_index("CCC"))
+    bottom_idx = np.full(N_DRAWS, post.team_index("DDD"))
+    sim = simulation.simulate_series(post, top_idx, bottom_idx, np.random.default_rng(2))
+
+    home_idx = np.where(simulation.HOME_ICE_PATTERN, top_idx[:, None], bottom_idx[:, None])
+    away_idx = np.where(simulation.HOME_ICE_PATTERN, bottom_idx[:, None], top_idx[:, None])
+    home_rate, away_rate = simulation.per_draw_log_rates(post, home_idx, away_idx)
+    top_wins = simulation.simulate_playoff_games(home_rate, away_rate, np.random.default_rng(2)) == simulation.HOME_ICE_PATTERN
+
+    for d in range(N_DRAWS):
+        played = top_wins[d, :sim.games[d]]
+        winner, loser = (played.sum(), (~played).sum())[::1 if sim.top_seed_win[d] else -1]
+        assert winner == 4 and loser < 4
+        assert played[-1] == sim.top_seed_win[d]
+
+
+def test_playoff_qualifiers():
+    # two 4 team divisions in one conference, a team without a division, a lone team in another conference
+    division = np.array(["A", "A", "A", "A", "B", "B", "B", "B", "", "C"])
+    conference = np.array(["E", "E", "E", "E", "E", "E", "E", "E", "", "W"])
+    score = np.array([
+        [10, 9, 8, 7, 6, 5, 4, 3, 100, 1],
+        [1, 2, 3, 4, 5, 6, 7, 8, 100, 1]
+    ], dtype=float)
+
+    qualified, wild_card = simulation.playoff_qualifiers(score, conference, division)
+
+    assert qualified.sum(axis=1).tolist() == [9, 9]
+    assert not qualified[:, 8].any()
+    assert qualified[:, 9].all()
+    # every division and conference team left out of the top 3 is a wild card, but only 2 per conference
+    assert wild_card[0].tolist() == [False, False, False, True, False, False, False, True, False, False]
+    assert wild_card[1].tolist() == [True, False, False, False, True, False, False, False, False, False]
+    assert not (wild_card & ~qualified).any()
+
+
+def test_project_season(post):
+    schedule = pl.DataFrame({
+        "home_team": ["AAA", "CCC", "EEE", "GGG", "BBB", "DDD"],
+        "away_team": ["BBB", "DDD", "FFF", "HHH", "HHH", "III"]
+    })
+    # HHH isn't in the standings, so it has no division and can't qualify
+    standings = pl.DataFrame({
+        "team": ["AAA", "BBB", "CCC", "DDD", "EEE", "FFF", "GGG", "III"],
+        "points": [10, 8, 6, 4, 12, 2, 7, 5],
+        "conference": ["E", "E", "E", "E", "W", "W", "W", "W"],
+        "division": ["A", "A", "A", "A", "C", "C", "C", "C"]
+    })
+
+    team_summary, rank_dist, playoff_line = simulation.project_season(post, schedule, standings, np.random.default_rng(3))
+
+    assert team_summary.shape[0] == len(TEAMS)
+    assert team_summary.filter(pl.col("team") == "HHH")["playoff_prob"].item() == 0
+    # 3 per division plus the one team left over in each conference as a wild card
+    assert team_summary["playoff_prob"].sum() == pytest.approx(8)
+    assert team_summary.filter(pl.col("conference") != "")["playoff_prob"].min() > 0
+    assert (team_summary["mean"] >= team_summary["current_points"]).all()
+
+    assert rank_dist.shape == (len(TEAMS), len(TEAMS) + 1)
+    assert np.allclose(rank_dist.drop("team").to_numpy().sum(axis=0), 1)
+    assert np.allclose(rank_dist.drop("team").to_numpy().sum(axis=1), 1)
+
+    # the line is the points of the conference's (single) wild card, the 4th team of its division
+    assert playoff_line["conference"].to_list() == ["E", "W"]
+    for row in playoff_line.to_dicts():
+        teams = team_summary.filter(pl.col("conference") == row["conference"])
+        assert teams["5%"].min() <= row["50%"] <= teams["95%"].max()
+
+
+def test_posterior_rng_is_keyed_by_the_posterior(post):
+    first = simulation.simulate_series(post, 0, 1, simulation.posterior_rng(post))
+    again = simulation.simulate_series(post, 0, 1, simulation.posterior_rng(post))
+    assert np.array_equal(first.games, again.games)
+
+    other = posterior_store.Posterior(post.season, post.max_date, "other", post.draws, post.team_id_map, post.mode, post.chains)
+    assert simulation.posterior_rng(post).random() != simulation.posterior_rng(other).random()
+    assert simulation.posterior_rng(post, 7).random() == np.random.default_rng(7).random()